@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+对比技能目录扫描性能: 旧的 rglob + 子串过滤 vs. os.scandir 剪枝遍历
+
+用法:
+  python3 benchmarks/bench_find_skill_dirs.py                 # 扫描 submodules/ 下所有仓库
+  python3 benchmarks/bench_find_skill_dirs.py path/to/repo -r 10
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+from typing import Callable, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from download_good_skills import SCRIPT_DIR, walk_skill_dirs  # noqa: E402
+
+
+def rglob_skill_dirs(repo_dir: Path) -> List[Path]:
+    """旧实现: rglob 遍历整个仓库（包括 .git），事后按子串过滤"""
+    return [p.parent for p in repo_dir.rglob("SKILL.md") if ".git" not in str(p)]
+
+
+def best_of(func: Callable, repo_dirs: List[Path], rounds: int) -> float:
+    """返回 rounds 轮中最快一轮扫描全部仓库的耗时（秒）"""
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for repo_dir in repo_dirs:
+            func(repo_dir)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="技能目录扫描微基准")
+    parser.add_argument("repos", nargs="*", type=Path, help="要扫描的仓库目录（默认: submodules/*）")
+    parser.add_argument("--rounds", "-r", type=int, default=5, help="重复轮数，取最快一轮（默认: 5）")
+    args = parser.parse_args()
+
+    repo_dirs = args.repos or sorted(p for p in (SCRIPT_DIR / "submodules").iterdir() if p.is_dir())
+    if not repo_dirs:
+        print("没有可扫描的仓库")
+        return
+
+    legacy = best_of(rglob_skill_dirs, repo_dirs, args.rounds)
+    pruned = best_of(lambda d: walk_skill_dirs(d), repo_dirs, args.rounds)
+    nested = best_of(lambda d: walk_skill_dirs(d, nested=True), repo_dirs, args.rounds)
+
+    legacy_count = sum(len(rglob_skill_dirs(d)) for d in repo_dirs)
+    pruned_count = sum(len(walk_skill_dirs(d)) for d in repo_dirs)
+    nested_count = sum(len(walk_skill_dirs(d, nested=True)) for d in repo_dirs)
+
+    print(f"仓库数: {len(repo_dirs)}, 轮数: {args.rounds}")
+    print(f"{'实现':<24}{'耗时 (ms)':>12}{'技能数':>10}{'加速比':>10}")
+    for label, elapsed, count in (
+        ("rglob (旧)", legacy, legacy_count),
+        ("scandir", pruned, pruned_count),
+        ("scandir --nested-skills", nested, nested_count),
+    ):
+        print(f"{label:<24}{elapsed * 1000:>12.2f}{count:>10}{legacy / elapsed:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
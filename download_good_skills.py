@@ -2,8 +2,9 @@
 """
 同步所有子模块到最新
 加载本地技能
+生成技能元数据索引 all_skills.json（解析 SKILL.md frontmatter）与本地搜索索引
 获取 skills.sh Top 100
-生成 Markdown（含 repo/skills 对应表）
+生成技能目录（Markdown/JSON/CSV，含 repo/skills 对应表）
 复制本地技能到 all_skills_collection/
 下载 skills.sh 仓库
 复制 skills.sh 技能到 all_skills_collection/
@@ -11,26 +12,140 @@
 """
 
 import argparse
+import csv
+import fnmatch
+import gzip
+import hashlib
 import json
 import os
+import random
 import shutil
 import re
-from pathlib import Path
-from typing import List, Dict, Optional, Set, Tuple
+import sqlite3
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from pathlib import Path, PurePosixPath
+from typing import Any, Callable, Iterable, Iterator, List, Dict, Optional, Set, Tuple
 import subprocess
 import sys
-import requests
+import threading
+import time
+import unicodedata
 from urllib.parse import urlparse
 
+try:
+    import fcntl
+except ImportError:  # Windows 不支持 reflink
+    fcntl = None
+
+try:
+    import brotli
+except ImportError:  # 可选依赖，缺失时只生成 .gz
+    brotli = None
+
 # 获取脚本所在目录
 SCRIPT_DIR = Path(__file__).parent.absolute()
 
 # 配置
 OUTPUT_MD = "ALL_SKILLS_INDEX.md"
+# 技能目录的输出格式及对应的默认文件名
+INDEX_FORMATS = ("markdown", "json", "csv")
+INDEX_FORMAT_LABELS = {"markdown": "Markdown ", "json": "JSON ", "csv": "CSV "}
+INDEX_DEFAULT_FILES = {"markdown": OUTPUT_MD, "json": "ALL_SKILLS_INDEX.json", "csv": "ALL_SKILLS_INDEX.csv"}
+INDEX_CSV_FIELDS = ("section", "rank", "name", "repo", "url", "installs")
+# 输入未变化时跳过重新生成；修改目录模板时递增以强制重新生成
+INDEX_FORMAT_VERSION = 2
+INDEX_STATE_FILE = "index_state.json"
 SKILLS_OUTPUT_DIR = "all_skills_collection"
 SKILLS_SH_DOWNLOADS_DIR = "skills_sh_downloads"
+# all_skills_collection 是指向其中某一代的符号链接，保留多代用于回滚
+GENERATIONS_DIR = ".all_skills_generations"
+# 集合增量同步清单，随集合目录（每一代）一起保存
+COLLECTION_MANIFEST_FILE = ".collection_manifest.json"
+DEFAULT_KEEP_GENERATIONS = 3
 TOP_100_COUNT = 100
 
+# skills.sh 排行榜抓取: 条件请求 + TTL 缓存
+SKILLS_SH_URL = "https://skills.sh"
+SKILLS_SH_CACHE_FILE = "skills_sh.json"
+DEFAULT_SKILLS_SH_TTL = 3600
+HTTP_POOL_SIZE = 8
+
+# 分页抓取 skills.sh 排行榜（Top 1000+），结果流式写入 JSONL 快照
+# 页面可以返回 JSON（列表或 {"skills": [...]}）或 HTML，模板中的 {page} 从 1 开始
+SKILLS_SH_PAGE_URL = "https://skills.sh/api/skills?page={page}"
+SKILLS_SH_SNAPSHOT_FILE = "skills_sh_snapshot.jsonl"
+SKILLS_SH_SNAPSHOT_META_FILE = "skills_sh_snapshot.json"
+DEFAULT_INGEST_JOBS = 4
+# 按首页大小估算所需页数后额外允许的页数，防止服务端忽略 {page} 时无限翻页
+INGEST_PAGE_SLACK = 5
+DEFAULT_SYNC_JOBS = 8
+
+# skills.sh 仓库并发克隆
+DEFAULT_CLONE_JOBS = 8
+DEFAULT_CLONE_PER_HOST = 6
+DEFAULT_CLONE_RETRIES = 2
+CLONE_BACKOFF_SECONDS = 2.0
+
+# 增量状态缓存目录（分支、远端 HEAD 等）
+CACHE_DIR = ".skills_cache"
+SYNC_STATE_FILE = "sync_state.json"
+SKILL_INDEX_FILE = "skill_index.json"
+SKILL_META_CACHE_FILE = "skill_meta.json"
+# 流水线各阶段（按声明顺序）；带指纹的阶段在输入与输出都未变化时跳过
+PIPELINE_STAGES = ("sync", "scan", "metadata", "fetch", "index", "download", "collect", "link")
+PIPELINE_STATE_FILE = "pipeline_state.json"
+PIPELINE_STATE_VERSION = 1
+# --profile 写出的 Chrome trace（chrome://tracing 或 https://ui.perfetto.dev 打开）
+PROFILE_TRACE_FILE = "pipeline_trace.json"
+PROFILE_SLOWEST_CALLS = 10
+# search 子命令使用的全文索引（SQLite FTS5，BM25 排序），扫描阶段增量更新
+SEARCH_INDEX_FILE = "search_index.sqlite"
+SEARCH_INDEX_VERSION = 1
+# BM25 列权重: name, description, tags, body
+SEARCH_COLUMN_WEIGHTS = (10.0, 4.0, 6.0, 1.0)
+DEFAULT_SEARCH_LIMIT = 10
+
+# 技能元数据索引（dashboard.html 加载），由 SKILL.md frontmatter 生成
+SKILLS_JSON = "all_skills.json"
+# dashboard.html 使用的分片目录: header.json（来源/标签计数）+ 按来源的分片
+CATALOG_DIR = "catalog"
+CATALOG_HEADER_FILE = "header.json"
+CATALOG_VERSION = 1
+CATALOG_FIELDS = ("name", "description", "license", "tags", "path")
+# 倒排搜索索引: 词 -> 技能 ID 列表；前 N 个字符的前缀 -> 有序词表中的区间
+CATALOG_SEARCH_FILE = "search.json"
+SEARCH_PREFIX_LEN = 3
+# 解析规则或 TAG_KEYWORDS 变化时递增，使元数据缓存失效
+SKILL_META_VERSION = 2
+# 在 SKILL.md 正文中按词匹配的标签关键词（输出为此处的规范写法）
+TAG_KEYWORDS = (
+    "API", "REST", "GraphQL", "gRPC", "WebSocket", "HTTP", "OAuth", "JWT",
+    "authentication", "authorization", "security", "OWASP", "penetration testing",
+    "testing", "TDD", "pytest", "Playwright", "Jest",
+    "Python", "JavaScript", "TypeScript", "Go", "Rust", "Java", "Kotlin", "Swift", "Ruby", "PHP",
+    "bash", "shell", "HTML", "CSS", "Tailwind", "React", "Next.js", "Vue", "Svelte", "Three.js",
+    "Node.js", "Express", "Django", "FastAPI", "Flask", "npm",
+    "git", "GitHub", "GitHub Actions", "CI/CD", "Docker", "Kubernetes", "Terraform",
+    "AWS", "Azure", "GCP", "PostgreSQL", "MySQL", "MongoDB", "Redis", "SQLite",
+    "LLM", "RAG", "MCP", "Claude", "Anthropic", "OpenAI", "prompt engineering",
+    "ETL", "pipeline", "analytics", "visualization", "dashboard",
+    "UI", "UX", "accessibility", "design", "documentation", "refactoring", "debugging", "performance",
+)
+
+# 技能落地到 all_skills_collection/ 的方式
+MATERIALIZE_MODES = ("copy", "hardlink", "reflink", "symlink")
+DEFAULT_MATERIALIZE_MODE = "copy"
+FICLONE = 0x40049409  # linux/fs.h: _IOW(0x94, 9, int)
+
+# 扫描技能时不进入的目录（另外还会遵循仓库根目录的 .gitignore）
+DEFAULT_SCAN_IGNORE_DIRS = frozenset({
+    ".git", "node_modules", ".venv", "venv", "__pycache__",
+    ".tox", ".nox", ".mypy_cache", ".pytest_cache", ".ruff_cache",
+    ".next", ".nuxt", ".turbo", ".cache",
+})
+
 # 技能源目录（AI 工具将链接到此目录）
 def get_skills_source_dir() -> Path:
     """获取技能源目录路径"""
@@ -90,41 +205,253 @@ class Colors:
     END = '\033[0m'
     BOLD = '\033[1m'
 
+# 线程内输出缓冲：并发任务先把输出写入缓冲，再由主线程按顺序整体打印
+_output_buffer = threading.local()
+
+def emit(text: str = ""):
+    """输出一行文本，当前线程开启了缓冲时写入缓冲"""
+    lines = getattr(_output_buffer, 'lines', None)
+    if lines is not None:
+        lines.append(text)
+    else:
+        print(text)
+
+@contextmanager
+def buffered_output():
+    """在当前线程内缓冲 emit/print_* 的输出，产出收集到的行列表"""
+    lines: List[str] = []
+    previous = getattr(_output_buffer, 'lines', None)
+    _output_buffer.lines = lines
+    try:
+        yield lines
+    finally:
+        # 允许嵌套：恢复外层缓冲
+        _output_buffer.lines = previous
+
 def print_header(text: str):
-    print(f"\n{Colors.HEADER}{Colors.BOLD}{'='*70}{Colors.END}")
-    print(f"{Colors.HEADER}{Colors.BOLD}{text:^70}{Colors.END}")
-    print(f"{Colors.HEADER}{Colors.BOLD}{'='*70}{Colors.END}\n")
+    emit(f"\n{Colors.HEADER}{Colors.BOLD}{'='*70}{Colors.END}")
+    emit(f"{Colors.HEADER}{Colors.BOLD}{text:^70}{Colors.END}")
+    emit(f"{Colors.HEADER}{Colors.BOLD}{'='*70}{Colors.END}\n")
 
 def print_success(text: str):
-    print(f"{Colors.GREEN}✓ {text}{Colors.END}")
+    emit(f"{Colors.GREEN}✓ {text}{Colors.END}")
 
 def print_info(text: str):
-    print(f"{Colors.CYAN}ℹ {text}{Colors.END}")
+    emit(f"{Colors.CYAN}ℹ {text}{Colors.END}")
 
 def print_warning(text: str):
-    print(f"{Colors.YELLOW}⚠ {text}{Colors.END}")
+    emit(f"{Colors.YELLOW}⚠ {text}{Colors.END}")
 
 def print_error(text: str):
-    print(f"{Colors.RED}✗ {text}{Colors.END}")
+    emit(f"{Colors.RED}✗ {text}{Colors.END}")
 
-def run_command(cmd: List[str], cwd: Optional[Path] = None, timeout: int = 120) -> tuple:
-    """运行命令并返回结果"""
+# 运行统计：按流水线阶段累计各项指标，并记录子进程等调用的区间
+_stage_context = threading.local()
+
+def current_stage() -> str:
+    """当前线程所属的流水线阶段（阶段之外为 main）"""
+    return getattr(_stage_context, 'name', 'main')
+
+def enter_stage(name: str):
+    """把当前线程的统计归属到指定阶段"""
+    _stage_context.name = name
+
+def stage_executor(max_workers: int) -> ThreadPoolExecutor:
+    """创建线程池，工作线程继承调用方所属的阶段"""
+    return ThreadPoolExecutor(max_workers=max_workers, initializer=enter_stage, initargs=(current_stage(),))
+
+def pad_display(text: str, width: int, left: bool = False) -> str:
+    """按终端显示宽度（中文等宽字符占两列）填充到 width 列，默认右对齐"""
+    padding = ' ' * max(0, width - sum(2 if unicodedata.east_asian_width(c) in 'WF' else 1 for c in text))
+    return text + padding if left else padding + text
+
+class Profiler:
+    """按阶段统计墙钟时间、子进程数、克隆字节数、复制/链接文件数与写入字节数
+
+    span() 记录的调用区间可导出为 Chrome trace（chrome://tracing 或 Perfetto 打开），
+    慢速的 git 远端在时间线上一目了然。
+    """
+
+    # files_linked: 以硬链接或 reflink 落地、没有复制数据的文件
+    COUNTERS = ('subprocesses', 'bytes_cloned', 'files_copied', 'files_linked', 'bytes_written')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.origin = time.perf_counter()
+        self.stages: Dict[str, Dict] = {}
+        self.events: List[Dict] = []
+
+    def _stage(self, name: str) -> Dict:
+        """阶段的统计项（调用方需持有 lock）"""
+        if name not in self.stages:
+            self.stages[name] = dict.fromkeys(self.COUNTERS, 0)
+            self.stages[name].update(seconds=0.0, status='')
+        return self.stages[name]
+
+    def count(self, counter: str, amount: int = 1):
+        with self.lock:
+            self._stage(current_stage())[counter] += amount
+
+    def finish_stage(self, name: str, seconds: float, status: str):
+        with self.lock:
+            stage = self._stage(name)
+            stage['seconds'] += seconds
+            stage['status'] = status
+
+    @contextmanager
+    def span(self, name: str, category: str, **fields):
+        """记录一段调用区间（Chrome trace 的完整事件）"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            event = {
+                'name': name, 'cat': category, 'ph': 'X', 'pid': os.getpid(), 'tid': threading.get_ident(),
+                'ts': round((start - self.origin) * 1e6), 'dur': round((end - start) * 1e6),
+                'args': dict(fields, stage=current_stage()),
+            }
+            with self.lock:
+                self.events.append(event)
+
+    def print_summary(self, slowest: int = 0):
+        """打印各阶段统计表；slowest > 0 时另列出最慢的若干个子进程/克隆调用"""
+        print_header("⏱ 各阶段耗时统计")
+        columns = ('耗时 (s)', '子进程', '克隆 (MB)', '复制文件', '链接文件', '写入 (MB)')
+        emit(pad_display('阶段', 10, left=True) + ''.join(pad_display(c, 12) for c in columns) + '  状态')
+        with self.lock:
+            stages = sorted(self.stages.items(), key=lambda item: (item[0] == 'main', item[0] not in PIPELINE_STAGES,
+                                                                  PIPELINE_STAGES.index(item[0])
+                                                                  if item[0] in PIPELINE_STAGES else 0))
+            events = sorted((e for e in self.events if e['cat'] != 'stage'), key=lambda e: -e['dur'])[:slowest]
+        for name, stage in stages:
+            emit(f"{name:<10}{stage['seconds']:>12.2f}{stage['subprocesses']:>12}"
+                 f"{stage['bytes_cloned'] / 1e6:>12.2f}{stage['files_copied']:>12}{stage['files_linked']:>12}"
+                 f"{stage['bytes_written'] / 1e6:>12.2f}  {stage['status']}")
+        if events:
+            emit(f"\n最慢的 {len(events)} 个调用:")
+            for event in events:
+                detail = event['args'].get('url') or event['args'].get('cmd', '')
+                emit(f"  {event['dur'] / 1e6:>8.2f}s  [{event['args']['stage']}] {event['name']}  {detail}")
+
+    def write_trace(self, path: Path):
+        """以 Chrome trace 格式写出记录的区间，阶段统计附在 metadata 中"""
+        with self.lock:
+            trace = {
+                'traceEvents': list(self.events),
+                'displayTimeUnit': 'ms',
+                'metadata': {'stages': self.stages},
+            }
+        save_json_state(path, trace)
+
+_profiler = Profiler()
+
+def load_json_state(path: Path, default=None):
+    """读取 JSON 状态文件，不存在或损坏时返回 default"""
     try:
-        result = subprocess.run(
-            cmd,
-            cwd=cwd,
-            capture_output=True,
-            text=True,
-            timeout=timeout
-        )
-        return result.returncode == 0, result.stdout, result.stderr
-    except subprocess.TimeoutExpired:
-        return False, "", "Command timed out"
-    except Exception as e:
-        return False, "", str(e)
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {} if default is None else default
+
+def save_json_state(path: Path, data) -> None:
+    """原子写入 JSON 状态文件（先写临时文件再 rename）"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2, sort_keys=True)
+        _profiler.count('bytes_written', f.tell())
+    os.replace(tmp_path, path)
+
+def run_command(cmd: List[str], cwd: Optional[Path] = None, timeout: int = 120) -> tuple:
+    """运行命令并返回结果（每次调用记为一个统计区间）"""
+    _profiler.count('subprocesses')
+    with _profiler.span(' '.join(cmd[:2]), 'subprocess', cmd=' '.join(cmd), cwd=str(cwd or '')):
+        try:
+            result = subprocess.run(
+                cmd,
+                cwd=cwd,
+                capture_output=True,
+                text=True,
+                timeout=timeout
+            )
+            return result.returncode == 0, result.stdout, result.stderr
+        except subprocess.TimeoutExpired:
+            return False, "", "Command timed out"
+        except Exception as e:
+            return False, "", str(e)
+
+def resolve_submodule_branch(path: str, configured_branch: str = "") -> str:
+    """从本地 git 元数据解析子模块跟踪的分支
+
+    优先级: .gitmodules 中配置的 branch > origin/HEAD > 上游分支 > 当前分支，
+    都没有时才通过 ls-remote --symref 询问远端一次。
+    """
+    if configured_branch:
+        return configured_branch
+    
+    cwd = Path(path)
+    success, stdout, _ = run_command(['git', 'symbolic-ref', '--short', 'refs/remotes/origin/HEAD'], cwd=cwd)
+    if success and stdout.strip().startswith('origin/'):
+        return stdout.strip()[len('origin/'):]
+    
+    success, stdout, _ = run_command(['git', 'rev-parse', '--abbrev-ref', '@{upstream}'], cwd=cwd)
+    if success and stdout.strip().startswith('origin/'):
+        return stdout.strip()[len('origin/'):]
+    
+    success, stdout, _ = run_command(['git', 'symbolic-ref', '--short', 'HEAD'], cwd=cwd)
+    if success and stdout.strip():
+        return stdout.strip()
+    
+    # 子模块通常处于 detached HEAD，最后询问远端默认分支
+    success, stdout, _ = run_command(['git', 'ls-remote', '--symref', 'origin', 'HEAD'], cwd=cwd)
+    if success:
+        match = re.search(r'^ref:\s+refs/heads/(\S+)\s+HEAD', stdout, re.MULTILINE)
+        if match:
+            return match.group(1)
+    
+    return "main"
 
-def sync_submodules():
-    """同步所有子模块到最新版本"""
+def pull_submodule(path: str, branch: str) -> Dict:
+    """检查远端分支 HEAD，仅在远端有新提交时拉取
+
+    返回: {'status': 'updated' | 'up_to_date' | 'failed', 'branch', 'remote_head', 'error'}
+    """
+    cwd = Path(path)
+    result = {'status': 'failed', 'branch': branch, 'remote_head': '', 'error': ''}
+    
+    success, stdout, stderr = run_command(['git', 'ls-remote', 'origin', f'refs/heads/{branch}'], cwd=cwd)
+    if not success or not stdout.strip():
+        result['error'] = stderr.strip() or f"远端不存在分支 {branch}"
+        return result
+    remote_head = stdout.split()[0]
+    result['remote_head'] = remote_head
+    
+    success, stdout, _ = run_command(['git', 'rev-parse', 'HEAD'], cwd=cwd)
+    if success and stdout.strip() == remote_head:
+        result['status'] = 'up_to_date'
+        return result
+    
+    # 远端 HEAD 已在本地（例如 submodule update 重置了工作区），直接检出，无需网络
+    success, _, _ = run_command(['git', 'cat-file', '-e', f'{remote_head}^{{commit}}'], cwd=cwd)
+    if success:
+        success, _, stderr = run_command(['git', 'checkout', '-q', remote_head], cwd=cwd)
+        if success:
+            result['status'] = 'up_to_date'
+            return result
+    
+    success, stdout, stderr = run_command(['git', 'pull', 'origin', branch], cwd=cwd)
+    if success:
+        result['status'] = 'updated'
+    else:
+        result['error'] = stderr.strip()
+    return result
+
+def sync_submodules(jobs: int = DEFAULT_SYNC_JOBS):
+    """同步所有子模块到最新版本
+
+    jobs: 并发拉取子模块的最大线程数
+    """
     print_header("🔄 同步所有子模块到最新")
     
     # 初始化子模块（如果尚未初始化）
@@ -136,7 +463,7 @@ def sync_submodules():
         print_success("子模块初始化完成")
     
     # 获取所有子模块路径
-    success, stdout, stderr = run_command(['git', 'submodule', 'foreach', 'pwd'], cwd=SCRIPT_DIR)
+    success, stdout, stderr = run_command(['git', 'submodule', '--quiet', 'foreach', 'pwd'], cwd=SCRIPT_DIR)
     if not success:
         print_error(f"无法获取子模块列表: {stderr}")
         return []
@@ -158,110 +485,202 @@ def sync_submodules():
     
     print_info(f"从 .gitmodules 加载了 {len(submodule_urls)} 个 URL 映射")
     
+    # .gitmodules 中显式配置的跟踪分支
+    success, stdout, stderr = run_command(['git', 'config', '--file', '.gitmodules', '--get-regexp', r'submodule\..*\.branch'], cwd=SCRIPT_DIR)
+    configured_branches = {}
+    if success:
+        for line in stdout.strip().split('\n'):
+            parts = line.split()
+            if len(parts) >= 2:
+                name_match = re.search(r'submodule\.(.*?)\.branch', parts[0])
+                if name_match:
+                    configured_branches[os.path.basename(name_match.group(1))] = parts[1]
+    
+    # 已缓存的分支解析结果
+    state_path = SCRIPT_DIR / CACHE_DIR / SYNC_STATE_FILE
+    sync_state = load_json_state(state_path)
+    
+    def sync_one(path: str) -> Dict:
+        submodule_name = os.path.basename(path)
+        cached = sync_state.get(submodule_name, {})
+        branch = configured_branches.get(submodule_name) or cached.get('branch') or resolve_submodule_branch(path)
+        return pull_submodule(path, branch)
+    
+    jobs = max(1, jobs)
+    print_info(f"使用 {min(jobs, max(1, len(submodule_paths)))} 个并发任务拉取子模块")
+    
     updated = 0
     failed = 0
     repo_info = []  # (name, path, url)
     
-    for i, path in enumerate(submodule_paths, 1):
-        submodule_name = os.path.basename(path)
-        # 尝试多种可能的 key 格式
-        url = submodule_urls.get(f"submodules/{submodule_name}", "")
-        if not url:
-            # 尝试直接用 submodule_name 作为 key
-            url = submodule_urls.get(submodule_name, "")
-        if not url:
-            # 尝试找到匹配的 key
-            for key in submodule_urls:
-                if key.endswith(f"/{submodule_name}"):
-                    url = submodule_urls[key]
-                    break
-        
-        print(f"\n[{i}/{len(submodule_paths)}] 更新 {submodule_name}...")
-        if url:
-            print_info(f"  URL: {url}")
-        else:
-            print_warning(f"  未找到 URL 映射")
-        
-        # 进入子模块目录并拉取最新
-        success, stdout, stderr = run_command(['git', 'pull', 'origin', 'main'], cwd=Path(path))
-        if not success:
-            # 尝试 master 分支
-            success, stdout, stderr = run_command(['git', 'pull', 'origin', 'master'], cwd=Path(path))
+    # 并发拉取，结果按子模块原始顺序输出
+    with stage_executor(jobs) as executor:
+        results = executor.map(sync_one, submodule_paths)
         
-        if success:
-            print_success(f"  ✓ {submodule_name} 已更新")
-            updated += 1
-        else:
-            # 可能是没有更新或者已经在最新
-            if "Already up to date" in stderr or "Already up-to-date" in stdout:
-                print_info(f"  ℹ {submodule_name} 已经是最新")
+        for i, (path, result) in enumerate(zip(submodule_paths, results), 1):
+            submodule_name = os.path.basename(path)
+            # 尝试多种可能的 key 格式
+            url = submodule_urls.get(f"submodules/{submodule_name}", "")
+            if not url:
+                # 尝试直接用 submodule_name 作为 key
+                url = submodule_urls.get(submodule_name, "")
+            if not url:
+                # 尝试找到匹配的 key
+                for key in submodule_urls:
+                    if key.endswith(f"/{submodule_name}"):
+                        url = submodule_urls[key]
+                        break
+            
+            emit(f"\n[{i}/{len(submodule_paths)}] 更新 {submodule_name}...")
+            if url:
+                print_info(f"  URL: {url}")
+            else:
+                print_warning(f"  未找到 URL 映射")
+            
+            if result['status'] == 'updated':
+                print_success(f"  ✓ {submodule_name} 已更新 ({result['branch']})")
+                updated += 1
+            elif result['status'] == 'up_to_date':
+                print_info(f"  ℹ {submodule_name} 已经是最新 ({result['branch']})")
                 updated += 1
             else:
-                print_warning(f"  ⚠ {submodule_name} 更新失败: {stderr[:100]}")
+                print_warning(f"  ⚠ {submodule_name} 更新失败: {result['error'][:100]}")
                 failed += 1
-        
-        repo_info.append((submodule_name, path, url))
+            
+            if result['status'] != 'failed':
+                sync_state[submodule_name] = {'branch': result['branch'], 'remote_head': result['remote_head']}
+            else:
+                # 分支可能已失效，下次重新解析
+                sync_state.pop(submodule_name, None)
+            
+            repo_info.append((submodule_name, path, url))
     
+    save_json_state(state_path, sync_state)
     print_success(f"\n子模块同步完成: {updated} 个成功, {failed} 个失败")
     return repo_info
 
-def fetch_skills_sh_top100() -> List[Dict]:
-    """从 skills.sh 页面抓取 Top 100 技能"""
+_http_session = None
+_http_session_lock = threading.Lock()
+
+def get_http_session():
+    """懒创建共享的 requests.Session（连接池复用 TCP/TLS 连接）"""
+    global _http_session
+    # 延迟导入: search 子命令等离线路径不需要加载 requests
+    import requests
+    from requests.adapters import HTTPAdapter
+    
+    with _http_session_lock:
+        if _http_session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers['User-Agent'] = "oh-my-skills/download_good_skills"
+            _http_session = session
+        return _http_session
+
+def parse_skills_sh_html(html: str) -> List[Dict]:
+    """从 skills.sh 页面 HTML 中解析技能列表（去重、截取 Top N）"""
+    skills = []
+    
+    # 尝试从页面中提取技能数据
+    # 查找包含技能名称和仓库的模式
+    # 常见模式: owner/repo 格式
+    
+    # 首先尝试找 JSON 数据
+    json_match = re.search(r'window\.__DATA__\s*=\s*(\{.*?\});', html, re.DOTALL)
+    if json_match:
+        try:
+            data = json.loads(json_match.group(1))
+            if 'skills' in data:
+                skills = data['skills'][:TOP_100_COUNT]
+        except:
+            pass
+    
+    # 如果没找到 JSON，尝试从 HTML 解析
+    if not skills:
+        # 查找技能链接或数据属性
+        skill_patterns = [
+            r'data-owner="([^"]+)"\s+data-repo="([^"]+)"',
+            r'href="/skills/([^/]+)/([^"]+)"',
+        ]
+        
+        for pattern in skill_patterns:
+            matches = re.findall(pattern, html)
+            for owner, repo in matches:
+                if owner and repo:
+                    skills.append({
+                        'name': f"{owner}/{repo}",
+                        'topSource': f"{owner}/{repo}",
+                        'installs': 0
+                    })
+    
+    # 去重
+    seen = set()
+    unique_skills = []
+    for skill in skills:
+        key = skill.get('topSource', skill.get('name', ''))
+        if key and key not in seen:
+            seen.add(key)
+            unique_skills.append(skill)
+    
+    # 限制数量
+    return unique_skills[:TOP_100_COUNT]
+
+def fetch_skills_sh_top100(ttl: int = DEFAULT_SKILLS_SH_TTL, offline: bool = False) -> List[Dict]:
+    """从 skills.sh 页面抓取 Top 100 技能
+
+    上次成功解析的结果连同 ETag/Last-Modified 缓存在 CACHE_DIR 中:
+    缓存未超过 ttl 秒时不发请求；过期后发条件请求，304 时直接复用缓存；
+    offline 时只使用缓存。请求失败时回退到缓存，没有缓存才用内置列表。
+    """
     print_header(f"🌐 从 skills.sh 获取 Top {TOP_100_COUNT} 技能")
+    
+    cache_path = SCRIPT_DIR / CACHE_DIR / SKILLS_SH_CACHE_FILE
+    cache = load_json_state(cache_path)
+    cached_skills = cache.get('skills') if cache.get('url') == SKILLS_SH_URL else None
+    age = time.time() - cache.get('fetched_at', 0)
+    
+    if offline:
+        if cached_skills:
+            print_info(f"离线模式: 使用缓存的 {len(cached_skills)} 个技能 ({int(age)} 秒前获取)")
+            return cached_skills
+        print_warning("离线模式且没有缓存，使用内置 Top 100 列表")
+        return get_builtin_top100()
+    
+    if cached_skills and 0 <= age < ttl:
+        print_info(f"使用缓存的 {len(cached_skills)} 个技能 ({int(age)} 秒前获取，TTL {ttl} 秒)")
+        return cached_skills
+    
     print_info("正在抓取 skills.sh 页面数据...")
+    import requests
+    
+    headers = {}
+    if cached_skills:
+        if cache.get('etag'):
+            headers['If-None-Match'] = cache['etag']
+        if cache.get('last_modified'):
+            headers['If-Modified-Since'] = cache['last_modified']
     
     try:
-        response = requests.get("https://skills.sh", timeout=30)
+        response = get_http_session().get(SKILLS_SH_URL, headers=headers, timeout=30)
+        if response.status_code == 304 and cached_skills:
+            cache['fetched_at'] = time.time()
+            save_json_state(cache_path, cache)
+            print_success(f"skills.sh 未变化 (304)，使用缓存的 {len(cached_skills)} 个技能")
+            return cached_skills
         response.raise_for_status()
-        html = response.text
-        
-        skills = []
-        
-        # 尝试从页面中提取技能数据
-        # 查找包含技能名称和仓库的模式
-        # 常见模式: owner/repo 格式
-        
-        # 首先尝试找 JSON 数据
-        json_match = re.search(r'window\.__DATA__\s*=\s*(\{.*?\});', html, re.DOTALL)
-        if json_match:
-            try:
-                data = json.loads(json_match.group(1))
-                if 'skills' in data:
-                    skills = data['skills'][:TOP_100_COUNT]
-            except:
-                pass
-        
-        # 如果没找到 JSON，尝试从 HTML 解析
-        if not skills:
-            # 查找技能链接或数据属性
-            skill_patterns = [
-                r'data-owner="([^"]+)"\s+data-repo="([^"]+)"',
-                r'href="/skills/([^/]+)/([^"]+)"',
-            ]
-            
-            for pattern in skill_patterns:
-                matches = re.findall(pattern, html)
-                for owner, repo in matches:
-                    if owner and repo:
-                        skills.append({
-                            'name': f"{owner}/{repo}",
-                            'topSource': f"{owner}/{repo}",
-                            'installs': 0
-                        })
-        
-        # 去重
-        seen = set()
-        unique_skills = []
-        for skill in skills:
-            key = skill.get('topSource', skill.get('name', ''))
-            if key and key not in seen:
-                seen.add(key)
-                unique_skills.append(skill)
         
-        # 限制数量
-        unique_skills = unique_skills[:TOP_100_COUNT]
+        unique_skills = parse_skills_sh_html(response.text)
         
         if unique_skills:
+            save_json_state(cache_path, {
+                'url': SKILLS_SH_URL,
+                'etag': response.headers.get('ETag', ''),
+                'last_modified': response.headers.get('Last-Modified', ''),
+                'fetched_at': time.time(),
+                'skills': unique_skills,
+            })
             print_success(f"成功获取 {len(unique_skills)} 个技能")
             return unique_skills
         else:
@@ -270,12 +689,181 @@ def fetch_skills_sh_top100() -> List[Dict]:
             
     except requests.RequestException as e:
         print_error(f"获取 skills.sh 失败: {e}")
+        if cached_skills:
+            print_info(f"使用上次成功获取的 {len(cached_skills)} 个技能 ({int(age)} 秒前)")
+            return cached_skills
         print_info("使用内置 Top 100 列表...")
         return get_builtin_top100()
     except Exception as e:
         print_error(f"解析失败: {e}")
         return get_builtin_top100()
 
+def parse_skills_sh_page(text: str) -> List[Dict]:
+    """解析一页排行榜: 优先按 JSON 解析，否则按 HTML 提取；只做字段规范化，不去重"""
+    try:
+        data = json.loads(text)
+    except ValueError:
+        data = None
+    if isinstance(data, dict):
+        data = next((data[k] for k in ('skills', 'data', 'items', 'results') if isinstance(data.get(k), list)), None)
+    if data is None:
+        return parse_skills_sh_html(text)
+    
+    skills = []
+    for item in data:
+        if not isinstance(item, dict) or not item.get('name'):
+            continue
+        skill = dict(item)
+        skill['topSource'] = item.get('topSource') or item.get('source') or item.get('repo') or ''
+        skill['installs'] = item.get('installs', 0) or 0
+        skills.append(skill)
+    return skills
+
+def fetch_skills_sh_page(url_template: str, page: int) -> List[Dict]:
+    """抓取并解析排行榜的一页"""
+    response = get_http_session().get(url_template.format(page=page), timeout=30)
+    response.raise_for_status()
+    return parse_skills_sh_page(response.text)
+
+def iter_skills_snapshot(limit: Optional[int] = None):
+    """逐行读取 JSONL 快照中的技能记录（按排名），读到 limit 条为止"""
+    path = SCRIPT_DIR / CACHE_DIR / SKILLS_SH_SNAPSHOT_FILE
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            for i, line in enumerate(f):
+                if limit is not None and i >= limit:
+                    break
+                yield json.loads(line)
+    except OSError:
+        return
+
+class SkillsSnapshot:
+    """JSONL 快照前 limit 条记录的惰性视图
+
+    每次迭代都从文件逐行重新读取，下游阶段不必在内存中持有整个排行榜；
+    支持 len()，供技能目录在写出排名表之前给出总数。
+    """
+
+    __slots__ = ('limit',)
+
+    def __init__(self, limit: int):
+        self.limit = limit
+
+    def __iter__(self) -> Iterator[Dict]:
+        return iter_skills_snapshot(self.limit)
+
+    def __len__(self) -> int:
+        return self.limit
+
+def ingest_skills_sh(target: int, url_template: str = SKILLS_SH_PAGE_URL, jobs: int = DEFAULT_INGEST_JOBS,
+                     ttl: int = DEFAULT_SKILLS_SH_TTL, offline: bool = False) -> int:
+    """分页并发抓取 skills.sh 排行榜前 target 个技能，写入 JSONL 快照，返回快照中的记录数
+
+    每批并发请求 jobs 页，按页码顺序增量解析；按 (topSource, name) 一次哈希去重，
+    记录逐条写入临时文件，完成后原子替换快照。遇到空页或失败页即停止。
+    快照足够新（ttl 内）或 offline 时直接复用，不发请求。
+    """
+    print_header(f"🌐 分页获取 skills.sh 排行榜 Top {target}")
+    
+    cache_dir = SCRIPT_DIR / CACHE_DIR
+    snapshot_path = cache_dir / SKILLS_SH_SNAPSHOT_FILE
+    meta_path = cache_dir / SKILLS_SH_SNAPSHOT_META_FILE
+    meta = load_json_state(meta_path)
+    usable = snapshot_path.is_file() and meta.get('url') == url_template
+    age = time.time() - meta.get('fetched_at', 0)
+    
+    if offline:
+        if usable:
+            print_info(f"离线模式: 使用快照中的 {meta.get('count', 0)} 个技能 ({int(age)} 秒前获取)")
+            return meta.get('count', 0)
+        print_warning("离线模式且没有排行榜快照")
+        return 0
+    if usable and 0 <= age < ttl and (meta.get('target', 0) >= target or meta.get('exhausted')):
+        print_info(f"使用快照中的 {meta.get('count', 0)} 个技能 ({int(age)} 秒前获取，TTL {ttl} 秒)")
+        return meta.get('count', 0)
+    
+    import requests
+    
+    jobs = max(1, jobs)
+    seen = set()
+    count = 0
+    page = 1
+    fetched_pages = 0
+    exhausted = False
+    failed = False
+    max_pages = None  # 拿到第一页后按页大小估算
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    tmp_path = snapshot_path.with_name(f".{snapshot_path.name}.tmp")
+    
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as out, stage_executor(jobs) as executor:
+            while count < target and not (exhausted or failed) and (max_pages is None or page <= max_pages):
+                pages = list(range(page, page + jobs))
+                futures = [executor.submit(fetch_skills_sh_page, url_template, p) for p in pages]
+                page += jobs
+                # 按页码顺序消费，保证排名连续；某页为空或失败时丢弃其后的页
+                for p, future in zip(pages, futures):
+                    if exhausted or failed or count >= target or (max_pages is not None and p > max_pages):
+                        future.cancel()
+                        continue
+                    try:
+                        skills = future.result()
+                    except (requests.RequestException, ValueError) as e:
+                        clear_progress()
+                        print_warning(f"第 {p} 页获取失败，停止分页: {e}")
+                        failed = True
+                        continue
+                    fetched_pages += 1
+                    if not skills:
+                        exhausted = True
+                        continue
+                    if max_pages is None:
+                        max_pages = -(-target // len(skills)) + INGEST_PAGE_SLACK
+                    added = 0
+                    for skill in skills:
+                        key = (skill.get('topSource', ''), skill.get('name', ''))
+                        if key in seen:
+                            continue
+                        seen.add(key)
+                        out.write(json.dumps(skill, ensure_ascii=False) + "\n")
+                        count += 1
+                        added += 1
+                        if count >= target:
+                            break
+                    print_progress(f"第 {p} 页: +{added} 个技能，共 {count} 个")
+                    if not added:
+                        # 整页都是已见过的记录（服务端忽略 {page} 或已到末尾），视为取完
+                        clear_progress()
+                        print_warning(f"第 {p} 页没有新的技能，停止分页")
+                        exhausted = True
+            _profiler.count('bytes_written', out.tell())
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    end_progress()
+    
+    # 中途失败且旧快照更完整时保留旧快照
+    if usable and failed and count < meta.get('count', 0):
+        tmp_path.unlink(missing_ok=True)
+        print_warning(f"只获取到 {count} 个技能，继续使用旧快照 ({meta.get('count', 0)} 个)")
+        return meta.get('count', 0)
+    if count == 0:
+        tmp_path.unlink(missing_ok=True)
+        print_warning("未获取到任何技能")
+        return 0
+    
+    os.replace(tmp_path, snapshot_path)
+    save_json_state(meta_path, {
+        'url': url_template,
+        'target': target,
+        'count': count,
+        # 排行榜已取完（而非请求失败）时，更大的 target 也无需重新抓取
+        'exhausted': exhausted and count < target,
+        'fetched_at': time.time(),
+    })
+    print_success(f"排行榜快照已更新: {count} 个技能，来自 {fetched_pages} 页 → {snapshot_path}")
+    return count
+
 def get_builtin_top100() -> List[Dict]:
     """内置的 Top 100 技能列表（作为备用）"""
     top100 = [
@@ -383,29 +971,19 @@ def get_builtin_top100() -> List[Dict]:
     print_success(f"使用内置列表: {len(top100)} 个技能")
     return top100
 
-def generate_markdown(repo_skills: Dict[str, List[Path]], skills_sh_skills: List[Dict], repo_info: List[Tuple[str, str, str]]) -> str:
-    """生成 Markdown 目录"""
-
-    print_info("生成 Markdown 目录...")
-    
-    # 计算本地技能总数
+def write_markdown_index(out, repo_skills: Dict[str, List[Path]], skills_sh_skills: Iterable[Dict],
+                         repo_urls: Dict[str, str], generated_at: str):
+    """按章节把 Markdown 目录流式写入 out"""
     total_local_skills = sum(len(skills) for skills in repo_skills.values())
     
-    # 构建本地技能名称到repo的映射
-    local_skill_to_repo = {}
-    for repo_name, skill_dirs in repo_skills.items():
-        repo_url = ""
-        for name, path, url in repo_info:
-            if name == repo_name:
-                repo_url = url
-                break
-        for skill_dir in skill_dirs:
-            local_skill_to_repo[skill_dir.name] = (repo_name, repo_url)
+    # 本地技能按 (技能名称, repo) 区分，不同仓库的同名技能各占一行
+    local_skills = sorted({(skill_dir.name, repo_name)
+                           for repo_name, skill_dirs in repo_skills.items() for skill_dir in skill_dirs})
 
     # 生成 Markdown - 简洁清晰的格式
-    md_content = f"""# 全部技能目录整合
+    out.write(f"""# 全部技能目录整合
 
-> 生成时间: {subprocess.check_output(['date', '+%Y-%m-%d %H:%M:%S']).decode().strip()}
+> 生成时间: {generated_at}
 
 ## 📊 统计概览
 
@@ -421,16 +999,16 @@ def generate_markdown(repo_skills: Dict[str, List[Path]], skills_sh_skills: List
 
 | 技能名称 | 来源仓库 | GitHub 地址 |
 |---------|---------|------------|
-"""
+""")
 
     # 添加本地技能列表 - 按字母排序
-    for skill_name in sorted(local_skill_to_repo.keys()):
-        repo_name, repo_url = local_skill_to_repo[skill_name]
+    for skill_name, repo_name in local_skills:
+        repo_url = repo_urls.get(repo_name, "")
         display_url = repo_url.replace('https://github.com/', '') if repo_url else 'N/A'
-        md_content += f"| `{skill_name}` | `{repo_name}` | [{display_url}]({repo_url}) |\n"
+        out.write(f"| `{skill_name}` | `{repo_name}` | [{display_url}]({repo_url}) |\n")
 
     # 添加 skills.sh 技能列表
-    md_content += f"""
+    out.write(f"""
 
 ---
 
@@ -438,58 +1016,48 @@ def generate_markdown(repo_skills: Dict[str, List[Path]], skills_sh_skills: List
 
 | 排名 | 技能名称 | 安装量 | 来源仓库 |
 |------|---------|--------|----------|
-"""
+""")
 
+    # 排名表与仓库分组在同一遍中完成，快照只需读取一次
+    repo_to_skills = {}
     for i, skill in enumerate(skills_sh_skills, 1):
         name = skill.get('name', 'unknown')
         installs = skill.get('installs', 0)
         source = skill.get('topSource', skill.get('source', 'unknown'))
-        md_content += f"| {i} | `{name}` | {installs:,} | `{source}` |\n"
+        out.write(f"| {i} | `{name}` | {installs:,} | `{source}` |\n")
+        if skill.get('name') and skill.get('topSource', skill.get('source')):
+            repo_to_skills.setdefault(source, []).append(name)
 
     # 添加仓库分组汇总
-    md_content += f"""
+    out.write("""
 
 ---
 
 ## 📁 按仓库分组的技能列表
 
-"""
+""")
 
     # 本地子模块分组
     if repo_skills:
-        md_content += "### 本地子模块\n\n"
+        out.write("### 本地子模块\n\n")
         for repo_name in sorted(repo_skills.keys()):
             skills = repo_skills[repo_name]
-            repo_url = ""
-            for name, path, url in repo_info:
-                if name == repo_name:
-                    repo_url = url
-                    break
-            
+            repo_url = repo_urls.get(repo_name, "")
             display_url = repo_url.replace('https://github.com/', '') if repo_url else 'N/A'
-            md_content += f"- **{repo_name}** ([{display_url}]({repo_url})): "
-            md_content += ", ".join([f"`{s.name}`" for s in skills])
-            md_content += "\n"
+            out.write(f"- **{repo_name}** ([{display_url}]({repo_url})): ")
+            out.write(", ".join([f"`{s.name}`" for s in skills]))
+            out.write("\n")
 
     # skills.sh 仓库分组
-    md_content += "\n### Skills.sh 仓库\n\n"
-    
-    # 按仓库分组统计 skills.sh 技能
-    from collections import defaultdict
-    repo_to_skills = defaultdict(list)
-    for skill in skills_sh_skills:
-        name = skill.get('name', '')
-        source = skill.get('topSource', skill.get('source', ''))
-        if name and source:
-            repo_to_skills[source].append(name)
+    out.write("\n### Skills.sh 仓库\n\n")
     
     for repo_name in sorted(repo_to_skills.keys()):
         skills = repo_to_skills[repo_name]
-        md_content += f"- **`{repo_name}`**: "
-        md_content += ", ".join([f"`{s}`" for s in skills])
-        md_content += "\n"
+        out.write(f"- **`{repo_name}`**: ")
+        out.write(", ".join([f"`{s}`" for s in skills]))
+        out.write("\n")
 
-    md_content += """
+    out.write("""
 
 ---
 
@@ -542,53 +1110,133 @@ npx skills add itech001/oh-my-skills --all
 ---
 
 *此文件由 `download_good_skills.py` 自动生成*
-"""
-
-    return md_content
-
-def save_markdown(content: str, filename: str = OUTPUT_MD):
-    """保存 Markdown 文件"""
-    output_path = SCRIPT_DIR / filename
-    print_info(f"保存 Markdown 文件到 {output_path}...")
-
-    with open(output_path, 'w', encoding='utf-8') as f:
-        f.write(content)
-
-    print_success(f"Markdown 文件已保存: {output_path}")
+""")
+
+def iter_index_rows(repo_skills: Dict[str, List[Path]], skills_sh_skills: Iterable[Dict], repo_urls: Dict[str, str]):
+    """按 JSON/CSV 导出的统一字段逐行产出技能记录"""
+    for repo_name in sorted(repo_skills):
+        for skill_dir in repo_skills[repo_name]:
+            yield {
+                'section': 'local',
+                'rank': None,
+                'name': skill_dir.name,
+                'repo': repo_name,
+                'url': repo_urls.get(repo_name, ""),
+                'installs': None,
+            }
+    for i, skill in enumerate(skills_sh_skills, 1):
+        source = skill.get('topSource', skill.get('source', ''))
+        yield {
+            'section': 'skills.sh',
+            'rank': i,
+            'name': skill.get('name', ''),
+            'repo': source,
+            'url': get_github_url(skill) or "",
+            'installs': skill.get('installs', 0),
+        }
+
+def write_json_index(out, repo_skills: Dict[str, List[Path]], skills_sh_skills: Iterable[Dict],
+                     repo_urls: Dict[str, str], generated_at: str):
+    """把技能目录以 JSON 流式写入 out（逐条写出，不在内存中拼出整个文档）"""
+    out.write('{\n  "generated_at": ' + json.dumps(generated_at) + ',\n  "skills": [')
+    for i, row in enumerate(iter_index_rows(repo_skills, skills_sh_skills, repo_urls)):
+        out.write(("," if i else "") + "\n    " + json.dumps(row, ensure_ascii=False))
+    out.write('\n  ]\n}\n')
+
+def write_csv_index(out, repo_skills: Dict[str, List[Path]], skills_sh_skills: Iterable[Dict],
+                    repo_urls: Dict[str, str], generated_at: str):
+    """把技能目录以 CSV 流式写入 out"""
+    writer = csv.DictWriter(out, fieldnames=INDEX_CSV_FIELDS, lineterminator='\n')
+    writer.writeheader()
+    writer.writerows(iter_index_rows(repo_skills, skills_sh_skills, repo_urls))
+
+INDEX_WRITERS = {
+    'markdown': write_markdown_index,
+    'json': write_json_index,
+    'csv': write_csv_index,
+}
 
-def scan_submodules_for_skills(repo_info: List[Tuple[str, str, str]]) -> Dict[str, List[Path]]:
-    """扫描所有子模块，查找包含 SKILL.md 的技能目录
-    返回: {repo_name: [skill_dir_paths]}
+def index_fingerprint(repo_skills: Dict[str, List[Path]], skills_sh_skills: Iterable[Dict],
+                      repo_urls: Dict[str, str], fmt: str) -> str:
+    """技能目录输入的指纹: 扫描到的技能、skills.sh 列表、仓库 URL 与输出格式"""
+    inputs = {
+        'version': INDEX_FORMAT_VERSION,
+        'format': fmt,
+        'top': TOP_100_COUNT,
+        'local': {repo: [d.name for d in dirs] for repo, dirs in sorted(repo_skills.items())},
+        'urls': repo_urls,
+    }
+    digest = hashlib.sha256(json.dumps(inputs, ensure_ascii=False, sort_keys=True).encode('utf-8'))
+    # skills.sh 列表逐条计入，不为指纹再构造一份完整列表
+    for s in skills_sh_skills:
+        row = [s.get('name', ''), s.get('installs', 0), s.get('topSource', s.get('source', ''))]
+        digest.update(json.dumps(row, ensure_ascii=False).encode('utf-8') + b"\n")
+    return digest.hexdigest()
+
+def save_index(repo_skills: Dict[str, List[Path]], skills_sh_skills: Iterable[Dict],
+               repo_info: List[Tuple[str, str, str]], filename: str = OUTPUT_MD, fmt: str = 'markdown',
+               force: bool = False) -> bool:
+    """生成技能目录（Markdown/JSON/CSV），写入临时文件后原子替换目标文件
+
+    输入指纹与上次生成时相同、且目标文件未被改动时跳过写入（force 时总是重新生成），
+    避免仅生成时间不同造成的 git diff。返回是否重新生成。
     """
-    print_header("🔍 扫描子模块中的 Skills")
+    label = INDEX_FORMAT_LABELS[fmt]
+    repo_urls = {name: url for name, _, url in repo_info}
+    output_path = SCRIPT_DIR / filename
     
-    repo_skills = {}
-    total_skills = 0
+    state_path = SCRIPT_DIR / CACHE_DIR / INDEX_STATE_FILE
+    state = load_json_state(state_path)
+    key = str(output_path.resolve())
+    fingerprint = index_fingerprint(repo_skills, skills_sh_skills, repo_urls, fmt)
+    previous = state.get(key, {})
+    if not force and previous.get('inputs') == fingerprint and output_path.is_file() \
+            and file_digest(str(output_path)) == previous.get('output'):
+        print_info(f"{label}目录输入未变化，跳过生成: {output_path}（--force 强制重新生成）")
+        return False
+    
+    print_info(f"生成 {label}目录...")
+    generated_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    tmp_path = output_path.with_name(f".{output_path.name}.tmp")
+    try:
+        with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+            INDEX_WRITERS[fmt](f, repo_skills, skills_sh_skills, repo_urls, generated_at)
+        _profiler.count('bytes_written', tmp_path.stat().st_size)
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
     
-    for repo_name, repo_path, repo_url in repo_info:
-        print(f"\n  扫描 {repo_name}...")
+    state[key] = {'inputs': fingerprint, 'output': file_digest(str(output_path))}
+    save_json_state(state_path, state)
+    print_success(f"{label}文件已保存: {output_path}")
+    return True
+
+def scan_repo_for_skills(repo_name: str, repo_path: str,
+                         ignore_dirs: Optional[Set[str]] = None, nested: bool = False) -> Tuple[List[Path], List[str]]:
+    """扫描单个仓库，返回 (技能目录列表, 缓冲的输出行)"""
+    with buffered_output() as lines:
+        emit(f"\n  扫描 {repo_name}...")
         print_info(f"    路径: {repo_path}")
         
         repo_path_obj = Path(repo_path)
         
         if not repo_path_obj.exists():
             print_warning(f"    仓库路径不存在: {repo_path}")
-            continue
+            return [], lines
         
         # 检查路径是否是目录
         if not repo_path_obj.is_dir():
             print_warning(f"    路径不是目录: {repo_path}")
-            continue
+            return [], lines
         
         # 查找所有包含 SKILL.md 的目录
-        skill_dirs = find_skill_dirs(repo_path_obj)
+        skill_dirs = find_skill_dirs(repo_path_obj, ignore_dirs=ignore_dirs, nested=nested)
         
         if skill_dirs:
-            repo_skills[repo_name] = skill_dirs
-            total_skills += len(skill_dirs)
             print_success(f"    发现 {len(skill_dirs)} 个技能")
             for skill_dir in skill_dirs:
-                print(f"      - {skill_dir.name}")
+                emit(f"      - {skill_dir.name}")
         else:
             print_info(f"    未发现技能 (检查了 {repo_path_obj})")
             # 调试：列出目录内容
@@ -599,43 +1247,822 @@ def scan_submodules_for_skills(repo_info: List[Tuple[str, str, str]]) -> Dict[st
             except Exception as e:
                 print_warning(f"    无法列出目录: {e}")
     
+    return skill_dirs, lines
+
+def scan_submodules_for_skills(repo_info: List[Tuple[str, str, str]],
+                               ignore_dirs: Optional[Set[str]] = None, nested: bool = False,
+                               jobs: int = DEFAULT_SYNC_JOBS) -> Dict[str, List[Path]]:
+    """扫描所有子模块，查找包含 SKILL.md 的技能目录
+    各仓库在线程池中并发扫描，输出按仓库缓冲后按 repo_info 顺序打印
+    返回: {repo_name: [skill_dir_paths]}
+    """
+    print_header("🔍 扫描子模块中的 Skills")
+    
+    repo_skills = {}
+    total_skills = 0
+    
+    with stage_executor(max(1, jobs)) as executor:
+        results = executor.map(
+            lambda info: scan_repo_for_skills(info[0], info[1], ignore_dirs, nested),
+            repo_info
+        )
+        for (repo_name, _, _), (skill_dirs, lines) in zip(repo_info, results):
+            for line in lines:
+                emit(line)
+            if skill_dirs:
+                repo_skills[repo_name] = skill_dirs
+                total_skills += len(skill_dirs)
+    
     print_success(f"\n扫描完成: 共 {total_skills} 个技能来自 {len(repo_skills)} 个仓库")
     return repo_skills
 
-def copy_local_skills(repo_skills: Dict[str, List[Path]], output_dir: Path) -> int:
-    """复制本地技能到统一目录"""
+def _parse_yaml_scalar(value: str):
+    """解析 frontmatter 中的单行标量: 去引号、支持 [a, b] 行内列表"""
+    value = value.strip()
+    if len(value) >= 2 and value[0] == value[-1] == '"':
+        try:
+            return json.loads(value)
+        except ValueError:
+            return value[1:-1]
+    if len(value) >= 2 and value[0] == value[-1] == "'":
+        return value[1:-1].replace("''", "'")
+    if value.startswith('[') and value.endswith(']'):
+        return [item for item in (_parse_yaml_scalar(v) for v in value[1:-1].split(',')) if item]
+    # 行尾注释
+    return re.sub(r'\s+#.*$', '', value)
+
+def _parse_yaml_block(lines: List[str], start: int, indent: int) -> Tuple[Dict, int]:
+    """解析缩进为 indent 的 key: value 块，返回 (映射, 下一行下标)"""
+    result = {}
+    i = start
+    while i < len(lines):
+        line = lines[i]
+        stripped = line.strip()
+        if not stripped or stripped.startswith('#'):
+            i += 1
+            continue
+        line_indent = len(line) - len(line.lstrip())
+        if line_indent < indent:
+            break
+        match = re.match(r'([^:\s][^:]*?)\s*:(?:\s+(.*))?$', stripped)
+        if not match or line_indent > indent:
+            i += 1
+            continue
+        key, value = match.group(1).strip(), (match.group(2) or "").strip()
+        i += 1
+        # 收集更深缩进的子行
+        child_start = i
+        while i < len(lines) and (not lines[i].strip() or len(lines[i]) - len(lines[i].lstrip()) > indent):
+            i += 1
+        children = lines[child_start:i]
+        content = [c.strip() for c in children if c.strip()]
+        if not value and not content:
+            # 列表项也可以与键同级缩进（tags:\n- pdf\n- docs）
+            while i < len(lines) and len(lines[i]) - len(lines[i].lstrip()) == indent \
+                    and lines[i].strip().startswith('- '):
+                content.append(lines[i].strip())
+                i += 1
+        
+        if value[:1] in ('|', '>'):
+            # 块标量: | 保留换行，> 折叠为空格
+            sep = '\n' if value[0] == '|' else ' '
+            result[key] = sep.join(content)
+        elif value:
+            # 多行纯标量的续行
+            result[key] = _parse_yaml_scalar(' '.join([value] + content)) if content else _parse_yaml_scalar(value)
+        elif content and content[0].startswith('- '):
+            result[key] = [_parse_yaml_scalar(c[2:]) for c in content if c.startswith('- ')]
+        elif content:
+            child_indent = min(len(c) - len(c.lstrip()) for c in children if c.strip())
+            result[key], _ = _parse_yaml_block(children, 0, child_indent)
+        else:
+            result[key] = ""
+    return result, i
+
+def parse_skill_frontmatter(text: str) -> Tuple[Dict, str]:
+    """拆分 SKILL.md 为 (frontmatter 映射, 正文)
+
+    只支持技能文件中常见的 YAML 子集（标量、引号、列表、块标量、一层嵌套），
+    不依赖 PyYAML；没有 frontmatter 时返回空映射。
+    """
+    lines = text.lstrip('\ufeff').splitlines()
+    if not lines or lines[0].strip() != '---':
+        return {}, text
+    for end in range(1, len(lines)):
+        if lines[end].strip() in ('---', '...'):
+            meta, _ = _parse_yaml_block(lines[1:end], 0, 0)
+            return meta, '\n'.join(lines[end + 1:])
+    return {}, text
+
+_tag_keyword_map = {kw.lower(): kw for kw in TAG_KEYWORDS}
+# 关键词正则较大，首次使用时才编译（search 子命令不需要）
+_tag_keyword_re: Optional[re.Pattern] = None
+
+def _get_tag_keyword_re() -> re.Pattern:
+    """懒编译 TAG_KEYWORDS 的按词匹配正则"""
+    global _tag_keyword_re
+    if _tag_keyword_re is None:
+        _tag_keyword_re = re.compile(
+            r'(?<![\w./-])(' + '|'.join(re.escape(kw) for kw in sorted(TAG_KEYWORDS, key=len, reverse=True))
+            + r')(?![\w/-]|\.\w)',
+            re.IGNORECASE
+        )
+    return _tag_keyword_re
+
+def extract_skill_tags(meta: Dict, body: str) -> List[str]:
+    """合并 frontmatter 中的 tags 与正文匹配到的关键词"""
+    tags = set()
+    nested = meta.get('metadata')
+    for declared in (meta.get('tags'), nested.get('tags') if isinstance(nested, dict) else None):
+        if isinstance(declared, str):
+            declared = declared.split(',')
+        if isinstance(declared, list):
+            tags.update(str(t).strip() for t in declared if str(t).strip())
+    description = meta.get('description')
+    text = f"{description if isinstance(description, str) else ''}\n{body}"
+    tags.update(_tag_keyword_map[m.lower()] for m in _get_tag_keyword_re().findall(text))
+    return sorted(tags, key=lambda t: (t.lower(), t))
+
+def parse_skill_metadata(skill_dir: Path, content: bytes) -> Dict:
+    """从 SKILL.md 内容提取 name/description/license/tags"""
+    meta, body = parse_skill_frontmatter(content.decode('utf-8', errors='replace'))
+    
+    def text_field(key: str) -> str:
+        value = meta.get(key, "")
+        if isinstance(value, list):
+            value = ", ".join(str(v) for v in value)
+        return str(value).strip() if not isinstance(value, dict) else ""
+    
+    return {
+        'name': text_field('name') or skill_dir.name,
+        'description': text_field('description'),
+        'license': text_field('license'),
+        'tags': extract_skill_tags(meta, body),
+    }
+
+def build_skills_json(repo_skills: Dict[str, List[Path]], filename: str = SKILLS_JSON) -> List[Dict]:
+    """根据扫描结果生成技能元数据索引（all_skills.json）
+
+    每个 SKILL.md 的解析结果按内容 sha256 缓存；mtime/size 未变时连文件都不读，
+    内容未变时只更新 stat，因此无变化时重新生成只需若干次 stat。
+    """
+    print_info("生成技能元数据索引...")
+    
+    cache_path = SCRIPT_DIR / CACHE_DIR / SKILL_META_CACHE_FILE
+    cache = load_json_state(cache_path)
+    if cache.get('version') != SKILL_META_VERSION:
+        cache = {'version': SKILL_META_VERSION, 'files': {}}
+    cached_files = cache['files']
+    files = {}
+    parsed = 0
+    records = []
+    digests = {}
+    
+    for repo_name in sorted(repo_skills):
+        for skill_dir in repo_skills[repo_name]:
+            skill_md = skill_dir / "SKILL.md"
+            key = str(skill_md)
+            try:
+                st = os.stat(key)
+            except OSError:
+                continue
+            stat_key = [st.st_mtime_ns, st.st_size]
+            entry = cached_files.get(key)
+            if not entry or entry['stat'] != stat_key:
+                try:
+                    content = skill_md.read_bytes()
+                except OSError:
+                    continue
+                digest = hashlib.sha256(content).hexdigest()
+                if not entry or entry['sha256'] != digest:
+                    entry = {'sha256': digest, 'meta': parse_skill_metadata(skill_dir, content)}
+                    parsed += 1
+                entry = dict(entry, stat=stat_key)
+            files[key] = entry
+            
+            meta = entry['meta']
+            try:
+                rel_path = skill_md.relative_to(SCRIPT_DIR).as_posix()
+            except ValueError:
+                rel_path = skill_md.as_posix()
+            digests[rel_path] = (skill_md, entry['sha256'])
+            records.append({
+                'name': meta['name'],
+                'description': meta['description'],
+                'source': repo_name,
+                'license': meta['license'],
+                'tags': meta['tags'],
+                'path': rel_path,
+                'repo': repo_name,
+            })
+    
+    records.sort(key=lambda r: (r['name'].lower(), r['repo'], r['path']))
+    if files != cached_files:
+        cache['files'] = files
+        save_json_state(cache_path, cache)
+    
+    output_path = SCRIPT_DIR / filename
+    content = (json.dumps(records, ensure_ascii=False, indent=2) + "\n").encode('utf-8')
+    status = "已更新" if write_static_file(output_path, content, compress=False) else "未变化"
+    print_success(f"技能元数据索引{status}: {output_path} ({len(records)} 个技能, {parsed} 个重新解析)")
+    
+    write_catalog(records)
+    update_search_index(records, digests)
+    return records
+
+def write_static_file(path: Path, content: bytes, compress: bool = True) -> bool:
+    """原子写入静态文件，并生成 .gz（以及可用时 .br）预压缩副本
+
+    内容未变且所有预压缩副本都在时直接跳过（不重新压缩），返回是否写入。
+    """
+    gz_path = path.with_name(f"{path.name}.gz")
+    br_path = path.with_name(f"{path.name}.br")
+    expected = [gz_path] + ([br_path] if brotli is not None else []) if compress else []
+    try:
+        if path.read_bytes() == content and all(p.exists() for p in expected):
+            return False
+    except OSError:
+        pass
+    
+    variants = [(path, content)]
+    stale = []
+    if compress:
+        variants.append((gz_path, gzip.compress(content, compresslevel=9, mtime=0)))
+        if brotli is not None:
+            variants.append((br_path, brotli.compress(content)))
+        else:
+            stale.append(br_path)
+    
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # 先写压缩副本，最后替换原文件，避免出现新文件配旧副本
+    for target, data in reversed(variants):
+        tmp_path = target.with_name(f".{target.name}.tmp")
+        _profiler.count('bytes_written', tmp_path.write_bytes(data))
+        os.replace(tmp_path, target)
+    for target in stale:
+        if target.exists():
+            target.unlink()
+    return True
+
+def catalog_shard_name(source: str) -> str:
+    """来源名转为安全的分片文件名"""
+    return re.sub(r'[^A-Za-z0-9._-]', '_', source) + ".json"
+
+def tokenize_search_text(text: str) -> List[str]:
+    """搜索分词: 小写后按非字母数字切分（与 dashboard.html 的 tokenize 一致）"""
+    return re.findall(r'[^\W_]+', text.lower())
+
+def delta_encode(ids: List[int]) -> List[int]:
+    """有序 ID 列表按差值编码，压缩 JSON 体积"""
+    return [ids[0]] + [b - a for a, b in zip(ids, ids[1:])] if ids else []
+
+def build_search_index(records: List[Dict], tag_table: List[str]) -> Dict:
+    """为 dashboard 构建倒排索引，技能 ID 为 records 中的下标
+
+    tokens/postings: 名称、描述、标签分词后的有序词表及对应的技能 ID 列表；
+    prefixes: 长度不超过 SEARCH_PREFIX_LEN 的前缀 -> 词表区间 [start, end)，
+    更长的查询词在该区间内二分查找；
+    tags: 与 header 标签表平行的技能 ID 列表。
+    所有 ID 列表均为差值编码。
+    """
+    postings = {}
+    tag_postings = {tag: [] for tag in tag_table}
+    for skill_id, record in enumerate(records):
+        text = " ".join([record['name'], record['description']] + record['tags'])
+        for token in set(tokenize_search_text(text)):
+            postings.setdefault(token, []).append(skill_id)
+        for tag in record['tags']:
+            tag_postings[tag].append(skill_id)
+    
+    tokens = sorted(postings)
+    prefixes = {}
+    for i, token in enumerate(tokens):
+        for length in range(1, min(len(token), SEARCH_PREFIX_LEN) + 1):
+            span = prefixes.setdefault(token[:length], [i, i + 1])
+            span[1] = i + 1
+    
+    return {
+        'version': CATALOG_VERSION,
+        'total': len(records),
+        'tokens': tokens,
+        'postings': [delta_encode(postings[token]) for token in tokens],
+        'prefixes': prefixes,
+        'tags': [delta_encode(tag_postings[tag]) for tag in tag_table],
+    }
+
+def write_catalog(records: List[Dict], catalog_dir: str = CATALOG_DIR) -> Dict:
+    """生成 dashboard 使用的紧凑分片目录
+
+    header.json 只包含来源/标签计数和分片清单，页面据此即可绘制筛选器与统计；
+    每个来源一个分片，技能按 CATALOG_FIELDS 存为数组，标签存为标签表下标；
+    search.json 为倒排搜索索引（见 build_search_index）。
+    所有文件附带 .gz/.br 预压缩副本，供静态服务器直接返回。
+    """
+    root = SCRIPT_DIR / catalog_dir
+    shard_dir = root / "shards"
+    
+    tag_counts = {}
+    by_source = {}
+    for record in records:
+        by_source.setdefault(record['source'], []).append(record)
+        for tag in record['tags']:
+            tag_counts[tag] = tag_counts.get(tag, 0) + 1
+    tags = sorted(tag_counts.items(), key=lambda item: (-item[1], item[0]))
+    tag_ids = {tag: i for i, (tag, _) in enumerate(tags)}
+    
+    sources = []
+    written = 0
+    for source in sorted(by_source):
+        rows = [[r['name'], r['description'], r['license'], [tag_ids[t] for t in r['tags']], r['path']]
+                for r in by_source[source]]
+        content = json.dumps({'version': CATALOG_VERSION, 'source': source, 'skills': rows},
+                             ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        shard = f"shards/{catalog_shard_name(source)}"
+        written += write_static_file(root / shard, content)
+        sources.append({
+            'name': source,
+            'count': len(rows),
+            'shard': shard,
+            'hash': hashlib.sha256(content).hexdigest()[:12],
+            'bytes': len(content),
+        })
+    
+    # 技能 ID 即在各分片按 sources 顺序拼接后的位置
+    ordered = [r for source in sorted(by_source) for r in by_source[source]]
+    offset = 0
+    for entry in sources:
+        entry['offset'] = offset
+        offset += entry['count']
+    
+    search_index = build_search_index(ordered, [tag for tag, _ in tags])
+    content = json.dumps(search_index, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    written += write_static_file(root / CATALOG_SEARCH_FILE, content)
+    
+    header = {
+        'version': CATALOG_VERSION,
+        'total': len(records),
+        'fields': list(CATALOG_FIELDS),
+        'sources': sources,
+        'tags': [[tag, count] for tag, count in tags],
+        'search': {'file': CATALOG_SEARCH_FILE, 'hash': hashlib.sha256(content).hexdigest()[:12]},
+    }
+    content = json.dumps(header, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    written += write_static_file(root / CATALOG_HEADER_FILE, content)
+    
+    # 清理已不存在的来源的分片
+    live = {PurePosixPath(entry['shard']).name for entry in sources}
+    if shard_dir.is_dir():
+        for entry in shard_dir.iterdir():
+            base = entry.name[:-3] if entry.name.endswith(('.gz', '.br')) else entry.name
+            if base not in live:
+                entry.unlink()
+                written += 1
+    
+    if written:
+        print_success(f"技能分片目录已更新: {root}/ ({len(sources)} 个来源分片, {written} 个文件变化)")
+    else:
+        print_info(f"技能分片目录未变化: {root}/")
+    return header
+
+def open_search_index(create: bool = True) -> Optional[sqlite3.Connection]:
+    """打开本地搜索索引；版本不符时重建，create=False 且不存在时返回 None"""
+    db_path = SCRIPT_DIR / CACHE_DIR / SEARCH_INDEX_FILE
+    if not create and not db_path.exists():
+        return None
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(db_path))
+    version = SEARCH_INDEX_VERSION * 1000 + SKILL_META_VERSION
+    if conn.execute('PRAGMA user_version').fetchone()[0] != version:
+        if not create:
+            conn.close()
+            return None
+        conn.executescript(f"""
+            DROP TABLE IF EXISTS docs;
+            DROP TABLE IF EXISTS docs_fts;
+            CREATE TABLE docs (id INTEGER PRIMARY KEY, path TEXT UNIQUE, sha256 TEXT,
+                               name TEXT, repo TEXT, description TEXT);
+            CREATE VIRTUAL TABLE docs_fts USING fts5(name, description, tags, body,
+                                                     tokenize='unicode61 remove_diacritics 2');
+            PRAGMA user_version = {version};
+        """)
+    return conn
+
+def update_search_index(records: List[Dict], digests: Dict[str, Tuple[Path, str]]):
+    """按 SKILL.md 内容 sha256 增量更新搜索索引，只重新读取变化的文件"""
+    try:
+        conn = open_search_index()
+    except sqlite3.Error as e:
+        print_warning(f"无法打开搜索索引（需要 SQLite FTS5）: {e}")
+        return
+    
+    updated = 0
+    with conn:
+        stored = {path: (doc_id, sha) for doc_id, path, sha in conn.execute('SELECT id, path, sha256 FROM docs')}
+        removed = stored.keys() - digests.keys()
+        for path in removed:
+            doc_id = stored[path][0]
+            conn.execute('DELETE FROM docs_fts WHERE rowid = ?', (doc_id,))
+            conn.execute('DELETE FROM docs WHERE id = ?', (doc_id,))
+        
+        for record in records:
+            skill_md, digest = digests[record['path']]
+            doc_id, old_digest = stored.get(record['path'], (None, None))
+            if old_digest == digest:
+                continue
+            try:
+                _, body = parse_skill_frontmatter(skill_md.read_bytes().decode('utf-8', errors='replace'))
+            except OSError:
+                continue
+            if doc_id is None:
+                doc_id = conn.execute('INSERT INTO docs (path) VALUES (?)', (record['path'],)).lastrowid
+            else:
+                conn.execute('DELETE FROM docs_fts WHERE rowid = ?', (doc_id,))
+            conn.execute('UPDATE docs SET sha256 = ?, name = ?, repo = ?, description = ? WHERE id = ?',
+                         (digest, record['name'], record['repo'], record['description'], doc_id))
+            conn.execute('INSERT INTO docs_fts (rowid, name, description, tags, body) VALUES (?, ?, ?, ?, ?)',
+                         (doc_id, record['name'], record['description'], " ".join(record['tags']), body))
+            updated += 1
+    conn.close()
+    
+    if updated or removed:
+        print_success(f"搜索索引已更新: {updated} 个新增/更新, {len(removed)} 个删除")
+    else:
+        print_info("搜索索引未变化")
+
+def search_skills(query: str, limit: int = DEFAULT_SEARCH_LIMIT, repo: Optional[str] = None) -> Optional[List[Dict]]:
+    """在本地索引中按 BM25 搜索技能，每个查询词按前缀匹配；索引不存在时返回 None"""
+    conn = open_search_index(create=False)
+    if conn is None:
+        return None
+    
+    tokens = tokenize_search_text(query)
+    if not tokens:
+        conn.close()
+        return []
+    match = " ".join(f'"{token}"*' for token in tokens)
+    weights = ", ".join(str(w) for w in SEARCH_COLUMN_WEIGHTS)
+    sql = f"""
+        SELECT d.name, d.repo, d.path, d.description, bm25(docs_fts, {weights}) AS score
+        FROM docs_fts JOIN docs d ON d.id = docs_fts.rowid
+        WHERE docs_fts MATCH ?{' AND d.repo = ?' if repo else ''}
+        ORDER BY score LIMIT ?
+    """
+    params = [match] + ([repo] if repo else []) + [limit]
+    rows = conn.execute(sql, params).fetchall()
+    conn.close()
+    return [{'name': name, 'repo': repo_name, 'path': path, 'description': description, 'score': round(-score, 3)}
+            for name, repo_name, path, description, score in rows]
+
+def parse_search_arguments(argv: List[str]):
+    """解析 search 子命令参数"""
+    parser = argparse.ArgumentParser(
+        prog=f"{os.path.basename(sys.argv[0])} search",
+        description='在本地技能索引中搜索（名称、描述、标签、正文，BM25 排序；不访问网络，不重新扫描仓库）',
+    )
+    parser.add_argument('query', nargs='+', help='搜索词，每个词按前缀匹配，多个词需同时命中')
+    parser.add_argument(
+        '--limit', '-n',
+        type=int,
+        default=DEFAULT_SEARCH_LIMIT,
+        metavar='N',
+        help=f'最多显示 N 条结果（默认: {DEFAULT_SEARCH_LIMIT}）'
+    )
+    parser.add_argument('--repo', type=str, help='只搜索指定仓库中的技能')
+    parser.add_argument('--json', action='store_true', help='以 JSON 输出结果')
+    return parser.parse_args(argv)
+
+def run_search(args) -> int:
+    """search 子命令入口，返回退出码"""
+    query = " ".join(args.query)
+    try:
+        results = search_skills(query, args.limit, args.repo)
+    except sqlite3.Error as e:
+        print_error(f"搜索失败: {e}")
+        return 1
+    if results is None:
+        print_error("搜索索引不存在，请先运行一次完整流程（扫描阶段会建立索引）")
+        return 1
+    
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+        return 0
+    if not results:
+        print_warning(f"没有匹配 \"{query}\" 的技能")
+        return 0
+    for i, result in enumerate(results, 1):
+        description = result['description']
+        if len(description) > 100:
+            description = description[:97] + "..."
+        emit(f"{i:>2}. {Colors.BOLD}{result['name']}{Colors.END} {Colors.CYAN}({result['repo']}){Colors.END} "
+             f"{result['score']:.2f}")
+        if description:
+            emit(f"    {description}")
+        emit(f"    {result['path']}")
+    return 0
+
+def reflink_file(src: str, dst: str) -> bool:
+    """通过 FICLONE ioctl 创建写时复制的 reflink（btrfs/XFS 等），不支持时返回 False"""
+    if fcntl is None:
+        return False
+    try:
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+    except OSError:
+        try:
+            os.unlink(dst)
+        except OSError:
+            pass
+        return False
+    shutil.copystat(src, dst)
+    return True
+
+def materialize_file(src: str, dst: str, mode: str = DEFAULT_MATERIALIZE_MODE) -> str:
+    """按 mode 落地单个文件，硬链接/reflink 不可用时逐文件回退为复制"""
+    if mode == "hardlink":
+        try:
+            os.link(src, dst)
+            _profiler.count('files_linked')
+            return dst
+        except OSError:
+            pass
+    elif mode == "reflink":
+        if reflink_file(src, dst):
+            _profiler.count('files_linked')
+            return dst
+    _profiler.count('files_copied')
+    _profiler.count('bytes_written', os.path.getsize(src))
+    return shutil.copy2(src, dst)
+
+def link_tree(src: Path, dest: Path):
+    """symlink 模式：整个技能目录落地为一个指向来源的符号链接（其余模式由 CollectionSync.sync_files 逐文件落地）"""
+    dest.symlink_to(src.resolve(), target_is_directory=True)
+
+def file_digest(path: str) -> str:
+    """计算文件内容的 sha256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def remove_path(path: Path):
+    """删除文件、符号链接或目录（不存在时忽略）"""
+    if path.is_symlink() or path.is_file():
+        path.unlink()
+    elif path.is_dir():
+        shutil.rmtree(path)
+
+class CollectionSync:
+    """增量、去重地同步 all_skills_collection/
+
+    技能按 (技能名称, 内容) 寻址：内容为文件树哈希（相对路径 + 各文件 sha256）。
+    - 不同来源中同名且内容完全相同的技能只落地一次，清单记录它的全部来源
+    - 名称不同的技能即使内容相同也各自落地，名称始终反映实际存在的技能
+    - 只有同名但内容不同（真正的冲突）才会落地为 skill_1、skill_2...
+    - 同一来源始终复用上次的目标名称，重复运行不会不断新增目录
+    - 来源文件的哈希按 (mtime_ns, size) 缓存，只重新落地内容确实变化的文件
+    - prune() 删除本次已没有任何来源的技能，以及清单中没有记录的遗留条目
+    """
+
+    MANIFEST_VERSION = 3
+
+    def __init__(self, output_dir: Path, materialize: str = DEFAULT_MATERIALIZE_MODE):
+        self.output_dir = output_dir
+        self.materialize = materialize
+        # 清单保存在集合目录内，始终与它描述的内容一致（分代构建时随暂存目录一起发布）
+        self.manifest_path = output_dir / COLLECTION_MANIFEST_FILE
+        manifest = load_json_state(self.manifest_path)
+        if manifest.get('version') != self.MANIFEST_VERSION:
+            manifest = {}
+        # 目标名称 -> {'skill', 'tree', 'mode', 'origins': [[origin, source]], 'files': {相对路径: sha256}}
+        self.skills: Dict[str, Dict] = manifest.get('skills', {})
+        # 来源目录 -> {相对路径: [mtime_ns, size, sha256]}
+        self.sources: Dict[str, Dict[str, List]] = manifest.get('sources', {})
+        # (技能名称, 树哈希) -> 目标名称
+        self.tree_to_name = {(entry['skill'], entry['tree']): name for name, entry in self.skills.items()}
+        self.source_to_name = {source: name for name, entry in self.skills.items()
+                               for _, source in entry['origins']}
+        self.placed: Set[str] = set()
+
+    def scan_source(self, src: Path, source: str) -> Dict[str, List]:
+        """列出来源目录的文件及哈希，mtime/size 未变的文件复用缓存的哈希"""
+        cached = self.sources.get(source, {})
+        files: Dict[str, List] = {}
+        for root, _, names in os.walk(src, followlinks=True):
+            for fname in names:
+                path = os.path.join(root, fname)
+                rel = Path(path).relative_to(src).as_posix()
+                stat = os.stat(path)
+                old = cached.get(rel)
+                if old and old[0] == stat.st_mtime_ns and old[1] == stat.st_size:
+                    files[rel] = old
+                else:
+                    files[rel] = [stat.st_mtime_ns, stat.st_size, file_digest(path)]
+        self.sources[source] = files
+        return files
+
+    @staticmethod
+    def tree_hash(files: Dict[str, List]) -> str:
+        """技能目录的内容地址"""
+        digest = hashlib.sha256()
+        for rel in sorted(files):
+            digest.update(f"{rel}\0{files[rel][2]}\n".encode('utf-8'))
+        return digest.hexdigest()
+
+    def owned_only_by(self, name: str, source: str) -> bool:
+        """名称未被占用，或只被该来源自己占用"""
+        entry = self.skills.get(name)
+        return entry is None or all(s == source for _, s in entry['origins'])
+
+    def resolve_name(self, source: str, skill_name: str) -> str:
+        """为来源目录分配稳定的目标名称"""
+        name = self.source_to_name.get(source)
+        if name and self.owned_only_by(name, source):
+            return name
+        candidate = skill_name
+        counter = 1
+        while not self.owned_only_by(candidate, source):
+            candidate = f"{skill_name}_{counter}"
+            counter += 1
+        return candidate
+
+    def detach(self, name: str, source: str):
+        """把来源从某个技能上移除，技能不再有来源时删除"""
+        entry = self.skills.get(name)
+        if entry is None:
+            return
+        entry['origins'] = [o for o in entry['origins'] if o[1] != source]
+        if not entry['origins']:
+            remove_path(self.output_dir / name)
+            self.tree_to_name.pop((entry['skill'], entry['tree']), None)
+            del self.skills[name]
+
+    def place(self, src: Path, skill_name: str, origin: str) -> Tuple[str, str]:
+        """落地一个技能目录
+
+        返回 (目标名称, 'added' | 'updated' | 'unchanged' | 'duplicate')，
+        duplicate 表示与其他来源已落地的技能内容相同，只记录了来源。
+        """
+        if not src.is_dir():
+            raise FileNotFoundError(f"技能目录不存在: {src}")
+        source = str(src.resolve())
+        files = self.scan_source(src, source)
+        tree = self.tree_hash(files)
+        self.placed.add(source)
+        
+        # 同名且内容相同的技能已存在时直接复用，否则分配名称
+        name = self.tree_to_name.get((skill_name, tree)) or self.resolve_name(source, skill_name)
+        previous = self.source_to_name.get(source)
+        if previous and previous != name:
+            self.detach(previous, source)
+        
+        entry = self.skills.get(name)
+        dest = self.output_dir / name
+        # 新挂到其他来源已落地的同内容技能上
+        duplicate = (entry is not None and entry['tree'] == tree
+                     and all(s != source for _, s in entry['origins']))
+        
+        if entry is None or entry.get('mode') != self.materialize or not (dest.exists() or dest.is_symlink()):
+            # 新技能或落地方式变化：整体重建
+            remove_path(dest)
+            if self.materialize == "symlink":
+                link_tree(src, dest)
+            else:
+                dest.mkdir(parents=True)
+                self.sync_files(src, dest, files, {})
+            status = 'added'
+        elif entry['tree'] == tree:
+            status = 'duplicate' if duplicate else 'unchanged'
+        else:
+            if self.materialize != "symlink":
+                self.sync_files(src, dest, files, entry['files'])
+            status = 'updated'
+        
+        origins = entry['origins'] if entry else []
+        if [origin, source] not in origins:
+            origins = origins + [[origin, source]]
+        if entry and entry['tree'] != tree:
+            self.tree_to_name.pop((entry['skill'], entry['tree']), None)
+        self.skills[name] = {
+            'skill': skill_name,
+            'tree': tree,
+            'mode': self.materialize,
+            'origins': origins,
+            'files': {rel: meta[2] for rel, meta in files.items()},
+        }
+        self.tree_to_name[(skill_name, tree)] = name
+        self.source_to_name[source] = name
+        return name, status
+
+    def sync_files(self, src: Path, dest: Path, files: Dict[str, List], old_files: Dict[str, str]):
+        """逐文件同步 src -> dest，只重新落地哈希变化的文件，删除已不存在的文件"""
+        for rel, meta in files.items():
+            dest_file = dest / rel
+            dest_present = dest_file.exists()
+            if old_files.get(rel) == meta[2] and dest_present:
+                continue
+            dest_file.parent.mkdir(parents=True, exist_ok=True)
+            if dest_present or dest_file.is_symlink():
+                dest_file.unlink()
+            materialize_file(str(src / rel), str(dest_file), self.materialize)
+        
+        removed = set(old_files) - set(files)
+        for rel in removed:
+            (dest / rel).unlink(missing_ok=True)
+        if removed:
+            # 清理删除文件后留下的空目录
+            for root, dirs, names in os.walk(dest, topdown=False):
+                if root != str(dest) and not dirs and not names:
+                    os.rmdir(root)
+
+    def prune(self, origin: str) -> int:
+        """移除该来源类型本次没有落地的来源，删除不再有任何来源的技能，返回删除数量"""
+        removed = 0
+        for name in list(self.skills):
+            entry = self.skills[name]
+            origins = [o for o in entry['origins'] if o[0] != origin or o[1] in self.placed]
+            if len(origins) == len(entry['origins']):
+                continue
+            for _, source in entry['origins']:
+                if [origin, source] not in origins and self.source_to_name.get(source) == name:
+                    self.source_to_name.pop(source, None)
+            if origins:
+                entry['origins'] = origins
+                dest = self.output_dir / name
+                # 符号链接模式下确保链接指向仍然存在的来源
+                if dest.is_symlink() and os.readlink(dest) not in {s for _, s in origins}:
+                    dest.unlink()
+                    link_tree(Path(origins[0][1]), dest)
+            else:
+                remove_path(self.output_dir / name)
+                self.tree_to_name.pop((entry['skill'], entry['tree']), None)
+                del self.skills[name]
+                removed += 1
+        
+        # 清单之外的顶层条目（如没有清单时遗留的 skill_1、skill_2…）同样删除
+        for path in list(self.output_dir.iterdir()):
+            if path.name in self.skills or path.name in ("README.md", COLLECTION_MANIFEST_FILE):
+                continue
+            remove_path(path)
+            removed += 1
+        return removed
+
+    def save(self):
+        """保存清单（丢弃不再被引用的来源缓存）"""
+        referenced = {source for entry in self.skills.values() for _, source in entry['origins']}
+        self.sources = {source: files for source, files in self.sources.items() if source in referenced}
+        save_json_state(self.manifest_path, {
+            'version': self.MANIFEST_VERSION,
+            'skills': self.skills,
+            'sources': self.sources,
+        })
+
+def report_placement(skill_name: str, dest_name: str, status: str):
+    """输出单个技能的落地结果（未变化的技能不输出）"""
+    if status == 'unchanged':
+        return
+    if status == 'duplicate':
+        print_info(f"    = {skill_name}: 与已有技能 {dest_name} 内容相同，只记录来源")
+        return
+    suffix = "" if status == 'added' else " (已更新)"
+    if dest_name != skill_name:
+        print_success(f"    ✓ {skill_name} (重命名为 {dest_name}){suffix}")
+    else:
+        print_success(f"    ✓ {skill_name}{suffix}")
+
+def copy_local_skills(repo_skills: Dict[str, List[Path]], output_dir: Path,
+                      materialize: str = DEFAULT_MATERIALIZE_MODE) -> int:
+    """增量同步本地技能到统一目录"""
     print_header("📦 复制本地子模块技能")
 
     output_dir.mkdir(exist_ok=True)
     print_info(f"目标目录: {output_dir.absolute()}")
+    print_info(f"落地方式: {materialize}")
 
+    collection = CollectionSync(output_dir, materialize)
     copied = 0
+    unchanged = 0
+    merged = 0
     skipped = 0
     
     for repo_name, skill_dirs in repo_skills.items():
-        print(f"\n  复制 {repo_name} 的技能...")
+        emit(f"\n  复制 {repo_name} 的技能...")
         
         for skill_dir in skill_dirs:
             # 技能名称使用目录名
             skill_name = skill_dir.name
-            dest_dir = output_dir / skill_name
-
-            # 如果已存在，添加前缀
-            counter = 1
-            original_dest = dest_dir
-            while dest_dir.exists():
-                dest_dir = output_dir / f"{skill_name}_{counter}"
-                counter += 1
 
             try:
-                # 复制整个目录
-                shutil.copytree(skill_dir, dest_dir)
-                copied += 1
+                dest_name, status = collection.place(skill_dir, skill_name, 'local')
+                report_placement(skill_name, dest_name, status)
                 
-                if original_dest != dest_dir:
-                    print_success(f"    ✓ {skill_name} (重命名为 {dest_dir.name})")
-                else:
-                    print_success(f"    ✓ {skill_name}")
+                if status == 'unchanged':
+                    unchanged += 1
+                    continue
+                if status == 'duplicate':
+                    merged += 1
+                    continue
+                copied += 1
 
                 if copied % 50 == 0:
                     print_info(f"  进度: 已复制 {copied} 个技能...")
@@ -644,8 +2071,13 @@ def copy_local_skills(repo_skills: Dict[str, List[Path]], output_dir: Path) -> i
                 print_error(f"    ✗ 复制失败 {skill_name}: {e}")
                 skipped += 1
 
-    print_success(f"\n本地技能复制完成: {copied} 个成功, {skipped} 个跳过")
-    return copied
+    # 扫描结果为空时（例如子模块同步失败）不清理，避免误删
+    removed = collection.prune('local') if repo_skills else 0
+    collection.save()
+
+    print_success(f"\n本地技能复制完成: {copied} 个更新, {unchanged} 个未变化, {merged} 个内容相同已合并, "
+                  f"{removed} 个已删除, {skipped} 个跳过")
+    return copied + unchanged + merged
 
 def get_github_url(skill: Dict) -> Optional[str]:
     """从 skill 信息中提取 GitHub repo URL"""
@@ -666,46 +2098,433 @@ def get_github_url(skill: Dict) -> Optional[str]:
 
     return None
 
+class SkillRef:
+    """skills.sh 技能的身份: (owner/repo, 仓库内技能路径)
+
+    排行榜只给出技能名，仓库内路径要到复制阶段扫描仓库后才能确定，
+    在此之前按 (owner/repo, 技能名) 去重。不同仓库的同名技能互不覆盖。
+    """
+
+    __slots__ = ('repo', 'name', 'url', 'path', 'dest')
+
+    def __init__(self, repo: str, name: str, url: str):
+        self.repo = repo                  # owner/repo
+        self.name = name                  # 排行榜上的技能名
+        self.url = url                    # GitHub 仓库 URL
+        self.path: Optional[str] = None   # 仓库内技能目录（POSIX 相对路径）
+        self.dest: Optional[str] = None   # 在 all_skills_collection/ 中的目标名称
+
+    @property
+    def repo_dir_name(self) -> str:
+        """下载目录名（owner-repo 格式）"""
+        return self.repo.replace('/', '-')
+
+    @property
+    def key(self) -> Tuple[str, str]:
+        """技能身份；路径确定之前以技能名代替"""
+        return (self.repo, self.path if self.path is not None else self.name)
+
+    def __repr__(self) -> str:
+        return f"SkillRef({self.repo}:{self.path or self.name})"
+
+def build_skill_refs(skills_sh_skills: Iterable[Dict]) -> List[SkillRef]:
+    """把排行榜记录转换为 SkillRef 列表（保持排名顺序，同一仓库的同名技能只保留一个）"""
+    refs: List[SkillRef] = []
+    seen: Set[Tuple[str, str]] = set()
+    for skill in skills_sh_skills:
+        skill_name = skill.get('name', '')
+        github_url = get_github_url(skill)
+        if not skill_name or not github_url:
+            continue
+        parts = github_url.replace('https://github.com/', '').split('/')
+        if len(parts) < 2:
+            continue
+        ref = SkillRef(f"{parts[0]}/{parts[1]}", skill_name, github_url)
+        if ref.key not in seen:
+            seen.add(ref.key)
+            refs.append(ref)
+    return refs
+
+def directory_size(path: Path) -> int:
+    """目录下所有文件的总字节数（不跟随符号链接）"""
+    total = 0
+    for root, _, names in os.walk(path):
+        for name in names:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
 def clone_repo(github_url: str, dest_dir: Path) -> bool:
     """克隆 GitHub 仓库到指定目录"""
-    try:
-        cmd = ['git', 'clone', '--depth', '1', github_url, str(dest_dir)]
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=120)
-        return result.returncode == 0
-    except Exception:
+    _profiler.count('subprocesses')
+    with _profiler.span('clone_repo', 'clone', url=github_url):
+        try:
+            cmd = ['git', 'clone', '--depth', '1', github_url, str(dest_dir)]
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=120)
+            return result.returncode == 0
+        except Exception:
+            return False
+
+def list_tree_skill_dirs(repo_dir: Path) -> List[str]:
+    """通过 git ls-tree 列出 HEAD 中包含 SKILL.md 的目录（只读树对象，不需要文件内容）"""
+    success, stdout, _ = run_command(['git', 'ls-tree', '-r', '--name-only', 'HEAD'], cwd=repo_dir)
+    if not success:
+        return []
+    return sorted({PurePosixPath(line).parent.as_posix() for line in stdout.splitlines()
+                   if PurePosixPath(line).name == "SKILL.md"})
+
+def set_sparse_skill_paths(repo_dir: Path, skill_names: Set[str], add: bool = False) -> bool:
+    """把 sparse-checkout 设置（或追加）为指定技能所在的目录
+
+    找不到任何指定技能时检出所有技能目录；技能位于仓库根目录时关闭 sparse-checkout。
+    """
+    tree_dirs = list_tree_skill_dirs(repo_dir)
+    wanted = [d for d in tree_dirs if PurePosixPath(d).name in skill_names] or tree_dirs
+    if not wanted:
+        return True
+    forget_repo_skill_dirs(repo_dir)
+    if "." in wanted:
+        success, _, _ = run_command(['git', 'sparse-checkout', 'disable'], cwd=repo_dir)
+        return success
+    success, _, _ = run_command(['git', 'sparse-checkout', 'add' if add else 'set', *wanted], cwd=repo_dir)
+    return success
+
+def is_sparse_checkout(repo_dir: Path) -> bool:
+    """仓库是否启用了 sparse-checkout"""
+    success, stdout, _ = run_command(['git', 'config', '--bool', 'core.sparseCheckout'], cwd=repo_dir)
+    return success and stdout.strip() == "true"
+
+def sparse_clone_repo(github_url: str, dest_dir: Path, skill_names: Set[str]) -> bool:
+    """无 blob 的浅克隆 + sparse-checkout，只下载指定技能目录的文件内容"""
+    with _profiler.span('sparse_clone_repo', 'clone', url=github_url):
+        success, _, _ = run_command(['git', 'clone', '--depth', '1', '--filter=blob:none', '--sparse',
+                                     github_url, str(dest_dir)])
+        return success and set_sparse_skill_paths(dest_dir, skill_names)
+
+def is_valid_clone(repo_dir: Path) -> bool:
+    """克隆是否完整：有 .git 目录且 HEAD 指向可读的 commit"""
+    if not (repo_dir / ".git").is_dir():
         return False
+    # 显式指定 --git-dir，避免 .git 损坏时 git 向上找到外层仓库
+    success, _, _ = run_command(['git', '--git-dir', str(repo_dir / ".git"),
+                                 'rev-parse', '--verify', '--quiet', 'HEAD^{commit}'])
+    return success
+
+def refresh_repo(repo_dir: Path) -> str:
+    """原地更新已有的浅克隆
+
+    一次 ls-remote 拿到远端默认分支及其 HEAD；与本地一致时不做任何下载，
+    否则 fetch --depth 1 后 reset --hard（遵循 sparse-checkout）。
+    返回: 'updated' | 'unchanged' | 'failed'
+    """
+    success, stdout, _ = run_command(['git', 'ls-remote', '--symref', 'origin', 'HEAD'], cwd=repo_dir)
+    branch_match = re.search(r'^ref:\s+refs/heads/(\S+)\s+HEAD', stdout, re.MULTILINE) if success else None
+    head_match = re.search(r'^([0-9a-f]{40,64})\s+HEAD', stdout, re.MULTILINE) if success else None
+    if not head_match:
+        return 'failed'
+    
+    success, local_head, _ = run_command(['git', 'rev-parse', 'HEAD'], cwd=repo_dir)
+    if success and local_head.strip() == head_match.group(1):
+        return 'unchanged'
+    
+    ref = branch_match.group(1) if branch_match else 'HEAD'
+    success, _, _ = run_command(['git', 'fetch', '--depth', '1', 'origin', ref], cwd=repo_dir)
+    if not success:
+        return 'failed'
+    success, _, _ = run_command(['git', 'reset', '--hard', '--quiet', 'FETCH_HEAD'], cwd=repo_dir)
+    return 'updated' if success else 'failed'
+
+def refresh_existing_clone(repo_dir: Path, host_slots: threading.Semaphore,
+                           skill_names: Optional[Set[str]] = None) -> str:
+    """在主机并发配额内刷新已有克隆；sparse 克隆随后补充检出需要的技能"""
+    with host_slots:
+        status = refresh_repo(repo_dir)
+    if skill_names is not None and is_sparse_checkout(repo_dir):
+        set_sparse_skill_paths(repo_dir, skill_names, add=True)
+    return status
+
+def clone_with_retry(github_url: str, dest_dir: Path, host_slots: threading.Semaphore,
+                     retries: int = DEFAULT_CLONE_RETRIES,
+                     skill_names: Optional[Set[str]] = None) -> Tuple[bool, int]:
+    """在主机并发配额内克隆仓库，失败时指数退避重试
+    给出 skill_names 时使用 sparse 克隆，只检出这些技能
+
+    返回: (是否成功, 尝试次数)
+    """
+    attempts = 0
+    for attempt in range(retries + 1):
+        attempts += 1
+        with host_slots:
+            if skill_names is not None:
+                cloned = sparse_clone_repo(github_url, dest_dir, skill_names)
+            else:
+                cloned = clone_repo(github_url, dest_dir)
+            if cloned:
+                _profiler.count('bytes_cloned', directory_size(dest_dir / ".git"))
+                return True, attempts
+        # 清理失败留下的半成品目录，退避期间不占用主机配额
+        remove_path(dest_dir)
+        if attempt < retries:
+            time.sleep(CLONE_BACKOFF_SECONDS * (2 ** attempt) + random.uniform(0, 1))
+    return False, attempts
+
+def print_progress(text: str):
+    """打印聚合进度行：终端中原地刷新，否则按行输出；输出被缓冲（后台阶段）时不打印"""
+    if getattr(_output_buffer, 'lines', None) is not None:
+        return
+    if sys.stdout.isatty():
+        print(f"\r\033[K{Colors.CYAN}ℹ {text}{Colors.END}", end='', flush=True)
+    else:
+        print_info(text)
+
+def clear_progress():
+    """清除终端中正在刷新的进度行，以便输出普通行；输出被缓冲时不做任何事"""
+    if getattr(_output_buffer, 'lines', None) is None and sys.stdout.isatty():
+        print("\r\033[K", end='')
+
+def end_progress():
+    """进度刷新结束后换行；输出被缓冲时不做任何事"""
+    if getattr(_output_buffer, 'lines', None) is None and sys.stdout.isatty():
+        print()
+
+# 技能目录清单缓存: {repo 绝对路径: {'head': commit, 'skills': [相对目录]}}
+_skill_index: Optional[Dict[str, Dict]] = None
+_skill_index_lock = threading.Lock()
+
+def _get_skill_index() -> Dict[str, Dict]:
+    """懒加载技能目录清单（调用方需持有 _skill_index_lock）"""
+    global _skill_index
+    if _skill_index is None:
+        _skill_index = load_json_state(SCRIPT_DIR / CACHE_DIR / SKILL_INDEX_FILE)
+    return _skill_index
+
+# 本次运行内的技能目录备忘: {(repo 绝对路径, 扫描选项): [相对目录]}
+# 下载阶段扫描过的仓库在复制阶段直接复用，不再调用 git 或遍历文件系统
+_repo_skill_dirs: Dict[Tuple[str, str], List[str]] = {}
+_repo_skill_dirs_lock = threading.Lock()
+
+def forget_repo_skill_dirs(repo_dir: Path):
+    """仓库内容（克隆、刷新、sparse 范围）变化后丢弃其备忘的扫描结果"""
+    key = str(repo_dir.resolve())
+    with _repo_skill_dirs_lock:
+        for memo_key in [k for k in _repo_skill_dirs if k[0] == key]:
+            del _repo_skill_dirs[memo_key]
+
+def get_repo_head(repo_dir: Path) -> str:
+    """获取仓库当前 HEAD commit，非 git 仓库根目录时返回空字符串"""
+    if not (repo_dir / '.git').exists():
+        return ""
+    success, stdout, _ = run_command(['git', 'rev-parse', 'HEAD'], cwd=repo_dir)
+    return stdout.strip() if success else ""
+
+def load_gitignore_patterns(repo_dir: Path) -> Tuple[List, List]:
+    """读取仓库根目录 .gitignore，编译为 (按目录名匹配, 按相对路径匹配) 两组正则
+
+    只支持常见子集：通配符、前导 / 锚定、尾部 / 表示目录；忽略否定规则 (!)。
+    """
+    name_patterns = []
+    path_patterns = []
+    try:
+        lines = (repo_dir / ".gitignore").read_text(encoding='utf-8', errors='ignore').splitlines()
+    except OSError:
+        return name_patterns, path_patterns
+    
+    for line in lines:
+        pattern = line.strip()
+        if not pattern or pattern.startswith('#') or pattern.startswith('!'):
+            continue
+        pattern = pattern.rstrip('/')
+        if '/' in pattern:
+            path_patterns.append(re.compile(fnmatch.translate(pattern.lstrip('/'))))
+        elif pattern:
+            name_patterns.append(re.compile(fnmatch.translate(pattern)))
+    return name_patterns, path_patterns
+
+def is_ignored_dir(rel_path: str, name: str, ignore_dirs: Set[str], gitignore_patterns: Tuple[List, List]) -> bool:
+    """判断目录是否应在扫描时被剪枝"""
+    if name in ignore_dirs:
+        return True
+    name_patterns, path_patterns = gitignore_patterns
+    return any(p.match(name) for p in name_patterns) or any(p.match(rel_path) for p in path_patterns)
+
+def walk_skill_dirs(repo_dir: Path, ignore_dirs: Optional[Set[str]] = None, nested: bool = False) -> List[str]:
+    """基于 os.scandir 遍历仓库，返回包含 SKILL.md 的目录（相对 repo_dir 的 POSIX 路径）
+
+    被忽略的目录在进入前就被剪枝；未启用 nested 时，找到 SKILL.md 的目录不再向下遍历。
+    """
+    if ignore_dirs is None:
+        ignore_dirs = DEFAULT_SCAN_IGNORE_DIRS
+    gitignore_patterns = load_gitignore_patterns(repo_dir)
+    
+    rel_dirs = []
+    stack = [(str(repo_dir), "")]
+    while stack:
+        abs_dir, rel_dir = stack.pop()
+        has_skill = False
+        subdirs = []
+        try:
+            with os.scandir(abs_dir) as entries:
+                for entry in entries:
+                    try:
+                        if entry.name == "SKILL.md":
+                            has_skill = has_skill or entry.is_file()
+                        elif entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.name)
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+        
+        if has_skill:
+            rel_dirs.append(rel_dir or ".")
+            if not nested:
+                continue
+        
+        for name in subdirs:
+            child_rel = f"{rel_dir}/{name}" if rel_dir else name
+            if is_ignored_dir(child_rel, name, ignore_dirs, gitignore_patterns):
+                continue
+            stack.append((os.path.join(abs_dir, name), child_rel))
+    
+    return sorted(rel_dirs)
+
+def diff_skill_dirs(repo_dir: Path, old_head: str, new_head: str, rel_dirs: List[str],
+                    ignore_dirs: Optional[Set[str]] = None, nested: bool = False) -> Optional[List[str]]:
+    """根据 git diff 增量更新技能目录列表
+
+    旧 commit 不可用（如浅克隆）、.gitignore 变化，或删除技能可能暴露出嵌套技能时
+    返回 None，由调用方回退为完整遍历。
+    """
+    if ignore_dirs is None:
+        ignore_dirs = DEFAULT_SCAN_IGNORE_DIRS
+    success, stdout, _ = run_command(['git', 'diff', '--name-only', '--no-renames', old_head, new_head], cwd=repo_dir)
+    if not success:
+        return None
+    
+    gitignore_patterns = load_gitignore_patterns(repo_dir)
+    skills = set(rel_dirs)
+    for changed in stdout.splitlines():
+        changed_path = PurePosixPath(changed.strip())
+        if changed_path.as_posix() == ".gitignore":
+            return None
+        if changed_path.name != "SKILL.md":
+            continue
+        skill_dir = changed_path.parent.as_posix()
+        # SKILL.md 新增/删除决定所在目录是否仍是技能
+        if (repo_dir / changed_path).is_file():
+            rel_path = ""
+            ignored = False
+            for part in changed_path.parent.parts:
+                rel_path = f"{rel_path}/{part}" if rel_path else part
+                if is_ignored_dir(rel_path, part, ignore_dirs, gitignore_patterns):
+                    ignored = True
+                    break
+            if not ignored:
+                skills.add(skill_dir)
+        elif skill_dir in skills:
+            if not nested:
+                return None
+            skills.discard(skill_dir)
+    
+    if not nested:
+        # 只保留最外层的技能目录
+        skills = {d for d in skills if not any(p.as_posix() in skills for p in PurePosixPath(d).parents)}
+    return sorted(skills)
 
-def find_skill_dirs(repo_dir: Path) -> List[Path]:
+def find_skill_dirs(repo_dir: Path, use_cache: bool = True,
+                    ignore_dirs: Optional[Set[str]] = None, nested: bool = False) -> List[Path]:
     """
     在仓库中查找技能目录
     Skill 定义为：包含 SKILL.md 文件的目录
     返回包含 SKILL.md 的目录路径列表
+
+    结果按仓库 HEAD commit 缓存：HEAD 未变时直接复用，HEAD 变化时只按
+    git diff 更新变化的技能目录，不再遍历文件系统。
+
+    ignore_dirs: 扫描时剪枝的目录名（默认 DEFAULT_SCAN_IGNORE_DIRS）
+    nested: 是否继续查找已有 SKILL.md 的目录下的嵌套技能
     """
-    skill_dirs = []
-    
+    if ignore_dirs is None:
+        ignore_dirs = DEFAULT_SCAN_IGNORE_DIRS
     if not repo_dir.exists():
         print_warning(f"      仓库不存在: {repo_dir}")
-        return skill_dirs
+        return []
     
-    # 使用 rglob 查找所有 SKILL.md 文件
-    skill_md_files = list(repo_dir.rglob("SKILL.md"))
-    print_info(f"      找到 {len(skill_md_files)} 个 SKILL.md 文件")
+    key = str(repo_dir.resolve())
+    options = f"nested={int(nested)};ignore={','.join(sorted(ignore_dirs))}"
+    if use_cache:
+        with _repo_skill_dirs_lock:
+            rel_dirs = _repo_skill_dirs.get((key, options))
+        if rel_dirs is not None:
+            print_info(f"      找到 {len(rel_dirs)} 个 SKILL.md 文件 (本次运行已扫描)")
+            return [repo_dir / rel_dir for rel_dir in rel_dirs]
     
-    for skill_md in skill_md_files:
-        # 跳过 .git 目录下的文件
-        if ".git" in str(skill_md):
-            continue
-        
-        # 获取包含 SKILL.md 的目录
-        skill_dir = skill_md.parent
-        skill_dirs.append(skill_dir)
+    head = get_repo_head(repo_dir) if use_cache else ""
+    memo_key = (key, options)
+    # 扫描选项或 sparse-checkout 范围变化时缓存失效
+    sparse_file = repo_dir / ".git" / "info" / "sparse-checkout"
+    if sparse_file.is_file():
+        options += f";sparse={file_digest(str(sparse_file))[:16]}"
     
-    return skill_dirs
-
-def download_skills_sh_repos(skills_sh_skills: List[Dict]) -> Tuple[Dict[str, Path], Dict[str, str]]:
+    rel_dirs = None
+    if head:
+        with _skill_index_lock:
+            entry = _get_skill_index().get(key)
+        if entry and entry.get('options') != options:
+            entry = None
+        if entry and entry.get('head') == head:
+            rel_dirs = entry['skills']
+            print_info(f"      找到 {len(rel_dirs)} 个 SKILL.md 文件 (HEAD 未变，使用缓存)")
+        elif entry:
+            rel_dirs = diff_skill_dirs(repo_dir, entry['head'], head, entry['skills'], ignore_dirs, nested)
+            if rel_dirs is not None:
+                print_info(f"      找到 {len(rel_dirs)} 个 SKILL.md 文件 (按 git diff 增量更新)")
+    
+    if rel_dirs is None:
+        rel_dirs = walk_skill_dirs(repo_dir, ignore_dirs, nested)
+        print_info(f"      找到 {len(rel_dirs)} 个 SKILL.md 文件")
+    
+    if head:
+        with _skill_index_lock:
+            index = _get_skill_index()
+            new_entry = {'head': head, 'options': options, 'skills': rel_dirs}
+            if index.get(key) != new_entry:
+                index[key] = new_entry
+                save_json_state(SCRIPT_DIR / CACHE_DIR / SKILL_INDEX_FILE, index)
+    if use_cache:
+        with _repo_skill_dirs_lock:
+            _repo_skill_dirs[memo_key] = rel_dirs
+    
+    return [repo_dir / rel_dir for rel_dir in rel_dirs]
+
+def prescan_skill_dirs(repo_dir: Path, ignore_dirs: Optional[Set[str]] = None, nested: bool = False):
+    """在下载线程中预先扫描刚克隆/刷新的仓库，结果留给复制阶段复用（输出丢弃）"""
+    forget_repo_skill_dirs(repo_dir)
+    with buffered_output():
+        find_skill_dirs(repo_dir, ignore_dirs=ignore_dirs, nested=nested)
+
+def group_skills_by_repo(skill_refs: List[SkillRef]) -> Dict[str, List[SkillRef]]:
+    """一次遍历把技能按下载目录名分组: repo_name -> [SkillRef]（保持原有顺序）"""
+    repo_to_skills: Dict[str, List[SkillRef]] = {}
+    for ref in skill_refs:
+        repo_to_skills.setdefault(ref.repo_dir_name, []).append(ref)
+    return repo_to_skills
+
+def download_skills_sh_repos(skills_sh_skills: Iterable[Dict], jobs: int = DEFAULT_CLONE_JOBS,
+                             per_host: int = DEFAULT_CLONE_PER_HOST,
+                             retries: int = DEFAULT_CLONE_RETRIES,
+                             sparse: bool = False, refresh: bool = False,
+                             prescan: bool = False, ignore_dirs: Optional[Set[str]] = None,
+                             nested: bool = False) -> Tuple[Dict[str, Path], List[SkillRef]]:
     """
     从 skills.sh 下载技能仓库到本地
-    返回: (repo_name -> repo_path 映射, skill_name -> repo_name 映射)
+    使用线程池并发克隆，每个主机同时最多 per_host 个克隆，失败后退避重试 retries 次
+    sparse 模式下无 blob 克隆并只检出需要的技能目录
+    refresh 模式下对已存在的克隆做浅 fetch + reset（远端未变化时跳过）；残缺的克隆总会被重新克隆
+    prescan 时在下载线程中顺带扫描克隆/刷新后的仓库，复制阶段复用扫描结果
+    返回: (repo_name -> repo_path 映射, 需要复制的 SkillRef 列表)
     """
     print_header("⬇️ 下载 Skills.sh Top 100 仓库")
 
@@ -714,130 +2533,322 @@ def download_skills_sh_repos(skills_sh_skills: List[Dict]) -> Tuple[Dict[str, Pa
 
     print_info(f"下载目录: {downloads_dir.absolute()}")
     
-    # 获取唯一的仓库列表，同时记录每个 skill 属于哪个 repo
-    repos_to_download: Dict[str, str] = {}  # repo_name -> github_url
-    skill_to_repo: Dict[str, str] = {}  # skill_name -> repo_name
-    
-    for skill in skills_sh_skills:
-        skill_name = skill.get('name', '')
-        github_url = get_github_url(skill)
-        if github_url:
-            # 提取 repo_name
-            parts = github_url.replace('https://github.com/', '').split('/')
-            if len(parts) >= 2:
-                # 使用 owner-repo 格式
-                repo_name = f"{parts[0]}-{parts[1]}"
-                if repo_name not in repos_to_download:
-                    repos_to_download[repo_name] = github_url
-                # 记录 skill 到 repo 的映射
-                if skill_name:
-                    skill_to_repo[skill_name] = repo_name
+    # 技能身份按 (owner/repo, 技能) 区分，不同仓库的同名技能都会保留
+    skill_refs = build_skill_refs(skills_sh_skills)
+    repo_to_skills = group_skills_by_repo(skill_refs)
+    repos_to_download: Dict[str, str] = {repo_name: refs[0].url  # repo_name -> github_url
+                                         for repo_name, refs in repo_to_skills.items()}
+    # repo_name -> 需要的技能名（sparse 模式使用）
+    repo_skill_names: Dict[str, Set[str]] = {repo_name: {ref.name for ref in refs}
+                                             for repo_name, refs in repo_to_skills.items()}
     
     print_info(f"发现 {len(repos_to_download)} 个唯一仓库需要下载")
-    print_info(f"涉及 {len(skill_to_repo)} 个特定技能")
+    print_info(f"涉及 {len(skill_refs)} 个特定技能")
 
     downloaded_repos: Dict[str, Path] = {}  # repo_name -> repo_path
     failed = 0
     skipped = 0
+    refreshed = 0
+    unchanged = 0
+    refresh_failed = 0
+    tasks: List[Tuple[str, str, str, Path]] = []  # (clone | refresh, repo_name, github_url, dest_dir)
 
-    for i, (repo_name, github_url) in enumerate(sorted(repos_to_download.items()), 1):
+    for repo_name, github_url in sorted(repos_to_download.items()):
         dest_dir = downloads_dir / repo_name
 
-        # 如果已存在，跳过
         if dest_dir.exists():
-            print_info(f"[{i}/{len(repos_to_download)}] 跳过 {repo_name} - 已存在")
+            # 超时等原因留下的残缺克隆：删除后重新克隆
+            if not is_valid_clone(dest_dir):
+                print_warning(f"{repo_name} 克隆不完整或已损坏，将重新克隆")
+                remove_path(dest_dir)
+                tasks.append(('clone', repo_name, github_url, dest_dir))
+                continue
+            if refresh:
+                tasks.append(('refresh', repo_name, github_url, dest_dir))
+                continue
+            # 已存在则跳过（sparse 克隆补充检出本次新增需要的技能）
+            if sparse and is_sparse_checkout(dest_dir):
+                set_sparse_skill_paths(dest_dir, repo_skill_names.get(repo_name, set()), add=True)
+            print_info(f"跳过 {repo_name} - 已存在")
             downloaded_repos[repo_name] = dest_dir
             skipped += 1
             continue
-
-        print(f"\n[{i}/{len(repos_to_download)}] 下载 {repo_name}...")
-        print(f"  URL: {github_url}")
-
-        try:
-            if clone_repo(github_url, dest_dir):
-                downloaded_repos[repo_name] = dest_dir
-                print_success(f"✓ 下载成功: {repo_name}")
+        tasks.append(('clone', repo_name, github_url, dest_dir))
+
+    if tasks:
+        # 每个主机一个信号量，限制对同一主机的并发克隆数
+        host_slots = {}
+        for _, _, github_url, _ in tasks:
+            host = urlparse(github_url).netloc
+            if host not in host_slots:
+                host_slots[host] = threading.BoundedSemaphore(max(1, per_host))
+        
+        mode = "sparse 无 blob 克隆" if sparse else "浅克隆"
+        to_clone = sum(1 for task in tasks if task[0] == 'clone')
+        print_info(f"并发{mode} {to_clone} 个仓库, 刷新 {len(tasks) - to_clone} 个仓库: "
+                   f"{max(1, jobs)} 个任务, 每个主机最多 {max(1, per_host)} 个, 失败重试 {retries} 次\n")
+        
+        def run_task(kind: str, github_url: str, dest_dir: Path, slots: threading.Semaphore,
+                     skill_names: Optional[Set[str]]):
+            """克隆或刷新一个仓库；需要时随后在同一线程内预扫描（不占用主机配额）"""
+            if kind == 'clone':
+                result = clone_with_retry(github_url, dest_dir, slots, retries, skill_names)
+                usable = result[0]
             else:
-                failed += 1
-                print_error(f"✗ 下载失败: {repo_name}")
-
-        except Exception as e:
-            failed += 1
-            print_error(f"✗ 异常: {repo_name} - {e}")
-
-        # 每 5 个显示进度
-        if i % 5 == 0:
-            print_info(f"进度: {i}/{len(repos_to_download)}, 成功: {len(downloaded_repos)}, 失败: {failed}, 跳过: {skipped}")
-
-    print_success(f"\n下载完成: {len(downloaded_repos)} 个成功, {failed} 个失败, {skipped} 个已存在")
-    return downloaded_repos, skill_to_repo
-
-def copy_skills_from_repos(repos: Dict[str, Path], skill_to_repo: Dict[str, str], output_dir: Path) -> Tuple[int, Dict[str, str]]:
+                result = refresh_existing_clone(dest_dir, slots, skill_names)
+                usable = True
+            if prescan and usable:
+                prescan_skill_dirs(dest_dir, ignore_dirs, nested)
+            return result
+        
+        cloned: Dict[str, Path] = {}
+        done = 0
+        with stage_executor(max(1, jobs)) as executor:
+            futures = {}
+            for kind, repo_name, github_url, dest_dir in tasks:
+                slots = host_slots[urlparse(github_url).netloc]
+                skill_names = repo_skill_names.get(repo_name, set()) if sparse else None
+                future = executor.submit(run_task, kind, github_url, dest_dir, slots, skill_names)
+                futures[future] = (kind, repo_name, github_url, dest_dir)
+            
+            for future in as_completed(futures):
+                kind, repo_name, github_url, dest_dir = futures[future]
+                done += 1
+                error = future.exception()
+                if error is not None:
+                    status = 'error'
+                elif kind == 'clone':
+                    success, attempts = future.result()
+                    status = 'cloned' if success else 'clone_failed'
+                else:
+                    status = future.result()
+                
+                clear_progress()
+                if status == 'cloned':
+                    cloned[repo_name] = dest_dir
+                    retried = f" (重试 {attempts - 1} 次)" if attempts > 1 else ""
+                    print_success(f"✓ 下载成功: {repo_name}{retried}")
+                elif status == 'updated':
+                    cloned[repo_name] = dest_dir
+                    refreshed += 1
+                    print_success(f"✓ 已刷新: {repo_name}")
+                elif status == 'unchanged':
+                    cloned[repo_name] = dest_dir
+                    unchanged += 1
+                    print_info(f"远端未变化: {repo_name}")
+                elif status == 'failed':
+                    # 刷新失败时旧版本仍然可用
+                    cloned[repo_name] = dest_dir
+                    refresh_failed += 1
+                    print_warning(f"刷新失败，保留现有版本: {repo_name}")
+                elif status == 'clone_failed':
+                    failed += 1
+                    print_error(f"✗ 下载失败: {repo_name} ({github_url})")
+                else:
+                    failed += 1
+                    print_error(f"✗ 异常: {repo_name} - {error}")
+                print_progress(f"进度: {done}/{len(tasks)}, 成功: {len(cloned) - refresh_failed}, "
+                               f"失败: {failed + refresh_failed}, 跳过: {skipped}")
+        
+        end_progress()
+        downloaded_repos.update(cloned)
+        downloaded_repos = dict(sorted(downloaded_repos.items()))
+
+    # 刷新失败的仓库仍使用旧版本（计入 downloaded_repos），但不算作成功
+    summary = (f"\n下载完成: {len(downloaded_repos) - skipped - refresh_failed} 个成功, {failed} 个失败, "
+               f"{skipped} 个已存在")
+    if refresh:
+        summary += f", {refreshed} 个已刷新, {unchanged} 个远端未变化, {refresh_failed} 个刷新失败（保留现有版本）"
+    print_success(summary)
+    return downloaded_repos, skill_refs
+
+def copy_skills_from_repos(repos: Dict[str, Path], skill_refs: List[SkillRef], output_dir: Path,
+                           ignore_dirs: Optional[Set[str]] = None, nested: bool = False,
+                           materialize: str = DEFAULT_MATERIALIZE_MODE) -> Tuple[int, List[SkillRef]]:
     """
-    从下载的仓库中复制特定的技能到统一目录
+    从下载的仓库中增量同步特定的技能到统一目录
     只复制在 skills.sh 列表中的技能，忽略 repo 中的其他技能
-    返回: (复制数量, skill_name -> repo_name 映射)
+    复制时为每个 SkillRef 确定仓库内路径 (path) 和目标名称 (dest)
+    返回: (复制数量, 成功复制的 SkillRef 列表)
     """
     print_header("📋 从下载的仓库复制指定技能")
     
     output_dir.mkdir(exist_ok=True)
     print_info(f"目标目录: {output_dir.absolute()}")
-    print_info(f"将复制 {len(skill_to_repo)} 个指定技能\n")
+    print_info(f"落地方式: {materialize}")
+    print_info(f"将复制 {len(skill_refs)} 个指定技能\n")
 
+    collection = CollectionSync(output_dir, materialize)
     total_copied = 0
+    unchanged = 0
+    merged = 0
     failed = 0
-    copied_skills: Dict[str, str] = {}  # 记录成功复制的 skill -> repo
+    copied_skills: List[SkillRef] = []  # 记录成功复制的技能
+
+    # 一次遍历按 repo 分组，避免为每个 repo 重新过滤整个列表
+    repo_to_skills = group_skills_by_repo(skill_refs)
 
     # 对于每个 repo，只查找并复制指定的 skills
     for repo_name, repo_path in sorted(repos.items()):
         # 获取该 repo 需要复制的 skills
-        skills_in_repo = {s: r for s, r in skill_to_repo.items() if r == repo_name}
+        skills_in_repo = repo_to_skills.get(repo_name, [])
         
         if not skills_in_repo:
             continue
         
-        print(f"  {repo_name}: 需要复制 {len(skills_in_repo)} 个技能")
+        emit(f"  {repo_name}: 需要复制 {len(skills_in_repo)} 个技能")
         
-        # 在 repo 中查找所有 skill 目录
-        all_skill_dirs = find_skill_dirs(repo_path)
+        # 在 repo 中查找所有 skill 目录（下载阶段已扫描过的直接复用）
+        all_skill_dirs = find_skill_dirs(repo_path, ignore_dirs=ignore_dirs, nested=nested)
         
-        # 创建 skill_name -> skill_dir 的映射
-        skill_dir_map = {d.name: d for d in all_skill_dirs}
+        # 创建 skill_name -> [skill_dir] 的映射（同一仓库内也可能有同名目录）
+        skill_dir_map: Dict[str, List[Path]] = {}
+        for d in all_skill_dirs:
+            skill_dir_map.setdefault(d.name, []).append(d)
         
         # 只复制指定的 skills
-        for skill_name in skills_in_repo:
+        for ref in skills_in_repo:
+            skill_name = ref.name
             if skill_name in skill_dir_map:
-                skill_dir = skill_dir_map[skill_name]
-                dest_dir = output_dir / skill_name
-                
-                # 如果已存在，添加前缀
-                counter = 1
-                original_dest = dest_dir
-                original_name = skill_name
-                while dest_dir.exists():
-                    skill_name = f"{original_name}_{counter}"
-                    dest_dir = output_dir / skill_name
-                    counter += 1
+                # 同名目录有多个时取层级最浅的那个
+                candidates = skill_dir_map[skill_name]
+                skill_dir = min(candidates, key=lambda d: (len(d.parts), d.as_posix()))
+                if len(candidates) > 1:
+                    print_warning(f"    ⚠ {skill_name}: 仓库中有 {len(candidates)} 个同名目录，"
+                                  f"使用 {skill_dir.relative_to(repo_path).as_posix()}")
+                ref.path = skill_dir.relative_to(repo_path).as_posix()
                 
                 try:
-                    shutil.copytree(skill_dir, dest_dir)
+                    dest_name, status = collection.place(skill_dir, skill_name, 'skills.sh')
+                    ref.dest = dest_name
                     total_copied += 1
-                    copied_skills[original_name] = repo_name
+                    copied_skills.append(ref)
+                    report_placement(skill_name, dest_name, status)
                     
-                    if original_dest != dest_dir:
-                        print_success(f"    ✓ {original_name} (重命名为 {skill_name})")
-                    else:
-                        print_success(f"    ✓ {original_name}")
+                    if status == 'unchanged':
+                        unchanged += 1
+                    elif status == 'duplicate':
+                        merged += 1
                 except Exception as e:
-                    print_error(f"    ✗ 复制失败 {original_name}: {e}")
+                    print_error(f"    ✗ 复制失败 {skill_name}: {e}")
                     failed += 1
             else:
                 print_warning(f"    ⚠ {skill_name}: 在仓库中未找到")
                 failed += 1
     
-    print_success(f"\n技能复制完成: {total_copied} 个成功, {failed} 个失败")
+    removed = collection.prune('skills.sh') if repos else 0
+    collection.save()
+    
+    print_success(f"\n技能复制完成: {total_copied} 个成功 (其中 {unchanged} 个未变化, {merged} 个内容相同已合并), "
+                  f"{removed} 个已删除, {failed} 个失败")
     return total_copied, copied_skills
 
+def list_generations() -> List[Path]:
+    """返回已发布的技能集合各代目录（从旧到新）"""
+    generations_dir = SCRIPT_DIR / GENERATIONS_DIR
+    if not generations_dir.is_dir():
+        return []
+    return sorted(p for p in generations_dir.iterdir() if p.is_dir() and p.name.startswith("gen-"))
+
+def current_generation() -> Optional[Path]:
+    """当前 all_skills_collection 指向的那一代"""
+    live_dir = get_skills_source_dir()
+    if not live_dir.is_symlink():
+        return None
+    return live_dir.resolve()
+
+def process_alive(pid: int) -> bool:
+    """进程是否仍在运行；无法安全探测（Windows）时保守地视为仍在运行"""
+    if pid == os.getpid():
+        return True
+    if os.name == 'nt':
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def begin_staged_build() -> Path:
+    """创建暂存目录，用硬链接从当前这一代预填充，供增量同步在其上构建
+
+    暂存目录名带有创建进程的 pid，只清理所属进程已退出的遗留目录，
+    不会删除另一个正在运行的构建的暂存目录。
+    """
+    generations_dir = SCRIPT_DIR / GENERATIONS_DIR
+    generations_dir.mkdir(exist_ok=True)
+    
+    # 清理中断遗留的暂存目录（旧版本创建的、不带 pid 的目录视为遗留）
+    for leftover in generations_dir.glob("staging-*"):
+        owner = re.search(r'-p(\d+)$', leftover.name)
+        if owner and process_alive(int(owner.group(1))):
+            continue
+        remove_path(leftover)
+    
+    staging_dir = generations_dir / f"staging-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-p{os.getpid()}"
+    live_dir = get_skills_source_dir()
+    if live_dir.is_dir():
+        # 同步时总是先 unlink 再写入，因此共享 inode 不会影响正在被读取的当前代
+        shutil.copytree(live_dir.resolve(), staging_dir, symlinks=True,
+                        copy_function=lambda s, d: materialize_file(s, d, "hardlink"))
+    else:
+        staging_dir.mkdir()
+    
+    print_info(f"暂存目录: {staging_dir}")
+    return staging_dir
+
+def switch_collection_link(generation: Path):
+    """原子地把 all_skills_collection 指向 generation（rename 覆盖符号链接）"""
+    live_dir = get_skills_source_dir()
+    tmp_link = live_dir.with_name(f".{live_dir.name}.tmp-link")
+    if tmp_link.is_symlink() or tmp_link.exists():
+        tmp_link.unlink()
+    tmp_link.symlink_to(generation.relative_to(live_dir.parent), target_is_directory=True)
+    os.replace(tmp_link, live_dir)
+
+def publish_generation(staging_dir: Path, keep: int = DEFAULT_KEEP_GENERATIONS) -> Path:
+    """发布暂存目录为新一代并原子切换，保留最近 keep 代用于回滚"""
+    live_dir = get_skills_source_dir()
+    generations_dir = SCRIPT_DIR / GENERATIONS_DIR
+    generation = generations_dir / staging_dir.name.replace("staging-", "gen-", 1)
+    os.replace(staging_dir, generation)
+    
+    # 旧版本留下的普通目录：一次性迁移为最早的一代
+    if live_dir.exists() and not live_dir.is_symlink():
+        legacy = generations_dir / "gen-00000000-legacy"
+        remove_path(legacy)
+        os.replace(live_dir, legacy)
+        print_warning(f"已将原有目录迁移为旧的一代: {legacy}")
+    
+    switch_collection_link(generation)
+    print_success(f"已发布新一代技能集合: {generation.name}")
+    
+    generations = list_generations()
+    for old in generations[:-max(1, keep)]:
+        if old != generation:
+            remove_path(old)
+    return generation
+
+def rollback_generation() -> bool:
+    """把 all_skills_collection 切回上一代"""
+    print_header("⏪ 回滚技能集合")
+    generations = list_generations()
+    current = current_generation()
+    if current not in generations:
+        print_error("当前技能集合不是分代发布的，无法回滚")
+        return False
+    
+    index = generations.index(current)
+    if index == 0:
+        print_warning(f"{current.name} 已是保留的最早一代")
+        return False
+    
+    switch_collection_link(generations[index - 1])
+    print_success(f"已回滚: {current.name} -> {generations[index - 1].name}")
+    return True
+
 def link_skills_to_ai_tools():
     """将技能链接到所有 AI 工具（创建符号链接）"""
     print_header("🔗 链接技能到所有 AI 工具")
@@ -919,7 +2930,7 @@ def link_skills_to_ai_tools():
             print_error(f"  ✗ {tool_name}")
             print(f"    -> {target_dir} (未链接)")
 
-def create_collection_readme():
+def create_collection_readme(output_dir: Optional[Path] = None):
     """创建集合目录的 README"""
     readme_content = f"""# 全部技能集合
 
@@ -946,14 +2957,285 @@ def create_collection_readme():
 *由 download_good_skills.py 自动生成*
 """
 
-    output_dir = SCRIPT_DIR / SKILLS_OUTPUT_DIR
+    if output_dir is None:
+        output_dir = SCRIPT_DIR / SKILLS_OUTPUT_DIR
     output_dir.mkdir(exist_ok=True)
     readme_path = output_dir / "README.md"
-    with open(readme_path, 'w', encoding='utf-8') as f:
+    # 写临时文件再替换：暂存目录中的 README 可能与当前代共享 inode
+    tmp_path = readme_path.with_name(".README.md.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
         f.write(readme_content)
+    os.replace(tmp_path, readme_path)
 
     print_success(f"创建 README: {readme_path}")
 
+def read_repo_head(repo_dir: Path) -> str:
+    """直接从 .git 读取 HEAD 指向的 commit（不启动 git 进程），读不到时回退为 git rev-parse"""
+    git_dir = repo_dir / '.git'
+    try:
+        if git_dir.is_file():
+            # 子模块的 .git 是内容为 "gitdir: <路径>" 的文件
+            git_dir = repo_dir / git_dir.read_text(encoding='utf-8').split(':', 1)[1].strip()
+        head = (git_dir / 'HEAD').read_text(encoding='utf-8').strip()
+        if not head.startswith('ref:'):
+            return head
+        ref = head[4:].strip()
+        ref_file = git_dir / ref
+        if ref_file.is_file():
+            return ref_file.read_text(encoding='utf-8').strip()
+        for line in (git_dir / 'packed-refs').read_text(encoding='utf-8').splitlines():
+            if line.endswith(f" {ref}"):
+                return line.split(' ', 1)[0]
+    except (OSError, IndexError):
+        pass
+    return get_repo_head(repo_dir)
+
+def path_signature(path: Path) -> Optional[List]:
+    """路径的廉价签名: 符号链接取链接目标，其他取 (mtime_ns, size)；不存在时为 None"""
+    if path.is_symlink():
+        return ['link', os.readlink(path)]
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+def skill_files_signature(repo_skills: Dict[str, List[Path]]) -> Dict[str, List]:
+    """扫描结果中每个 SKILL.md 的签名（只做 stat，不读内容）"""
+    return {repo_name: [[str(d), path_signature(d / "SKILL.md")] for d in skill_dirs]
+            for repo_name, skill_dirs in sorted(repo_skills.items())}
+
+class Stage:
+    """流水线中的一个阶段
+
+    run(results) 执行阶段并返回结果，results 中是已完成阶段的结果；
+    inputs(results) 返回可 JSON 序列化的输入描述（None 表示无法判断，总是执行），
+    outputs(results) 返回阶段产出的路径。输入与输出签名都与上次相同时跳过该阶段。
+    """
+
+    __slots__ = ('name', 'run', 'deps', 'inputs', 'outputs')
+
+    def __init__(self, name: str, run: Callable[[Dict], Any], deps: Tuple[str, ...] = (),
+                 inputs: Optional[Callable[[Dict], Any]] = None,
+                 outputs: Optional[Callable[[Dict], List[Path]]] = None):
+        self.name = name
+        self.run = run
+        self.deps = deps
+        self.inputs = inputs
+        self.outputs = outputs
+
+class Pipeline:
+    """阶段 DAG: 依赖都完成的阶段并发执行，输入与输出都未变化的阶段直接跳过
+
+    同一时刻只有一个阶段直接输出（前台），其他并发阶段的输出先缓冲，
+    等前台阶段结束后再整段输出，避免多个阶段的日志交错。
+    """
+
+    def __init__(self, stages: List[Stage], force: bool = False):
+        self.stages = {stage.name: stage for stage in stages}
+        self.order = [stage.name for stage in stages]
+        self.force = force
+        self.state_path = SCRIPT_DIR / CACHE_DIR / PIPELINE_STATE_FILE
+        state = load_json_state(self.state_path)
+        self.state: Dict[str, Dict] = state.get('stages', {}) if state.get('version') == PIPELINE_STATE_VERSION else {}
+
+    def plan(self, targets: List[str]) -> List[str]:
+        """目标阶段及其全部依赖（按声明顺序）"""
+        needed: Set[str] = set()
+        stack = list(targets)
+        while stack:
+            name = stack.pop()
+            if name not in needed:
+                needed.add(name)
+                stack.extend(self.stages[name].deps)
+        return [name for name in self.order if name in needed]
+
+    def output_signatures(self, stage: Stage, results: Dict) -> Dict[str, Optional[List]]:
+        if stage.outputs is None:
+            return {}
+        return {str(path): path_signature(path) for path in stage.outputs(results)}
+
+    def execute(self, stage: Stage, results: Dict, live: bool) -> Tuple[Any, List[str], Optional[Dict]]:
+        """执行或跳过一个阶段，返回 (结果, 缓冲的输出行, 新的阶段指纹)；跳过时结果为 None"""
+        enter_stage(stage.name)
+        start = time.perf_counter()
+        status = '失败'
+        try:
+            with _profiler.span(stage.name, 'stage'):
+                result, lines, fingerprint, skipped = self._execute(stage, results, live)
+            status = '跳过' if skipped else '执行'
+            return result, lines, fingerprint
+        finally:
+            _profiler.finish_stage(stage.name, time.perf_counter() - start, status)
+            enter_stage('main')
+
+    def _execute(self, stage: Stage, results: Dict, live: bool) -> Tuple[Any, List[str], Optional[Dict], bool]:
+        with (nullcontext([]) if live else buffered_output()) as lines:
+            inputs = stage.inputs(results) if stage.inputs else None
+            if inputs is None:
+                return stage.run(results), lines, None, False
+            
+            digest = hashlib.sha256(json.dumps(inputs, ensure_ascii=False, sort_keys=True,
+                                               default=str).encode('utf-8')).hexdigest()
+            previous = self.state.get(stage.name, {})
+            if not self.force and previous.get('inputs') == digest:
+                outputs = self.output_signatures(stage, results)
+                if outputs == previous.get('outputs') and None not in outputs.values():
+                    print_info(f"阶段 {stage.name}: 输入与输出均未变化，跳过（--force 强制执行）")
+                    return None, lines, None, True
+            
+            result = stage.run(results)
+            return result, lines, {'inputs': digest, 'outputs': self.output_signatures(stage, results)}, False
+
+    def run(self, targets: List[str]) -> Dict[str, Any]:
+        """运行目标阶段及其依赖，返回各阶段的结果"""
+        plan = self.plan(targets)
+        results: Dict[str, Any] = {}
+        pending = list(plan)
+        running = {}
+        foreground = None  # 当前直接输出的阶段
+        deferred: List[str] = []  # 后台阶段缓冲的输出
+        
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, len(plan))) as executor:
+                while pending or running:
+                    for name in [n for n in pending if all(d in results for d in self.stages[n].deps)]:
+                        pending.remove(name)
+                        live = foreground is None
+                        if live:
+                            foreground = name
+                        running[executor.submit(self.execute, self.stages[name], results, live)] = name
+                    
+                    finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        name = running.pop(future)
+                        if name == foreground:
+                            foreground = None
+                        result, lines, fingerprint = future.result()
+                        results[name] = result
+                        deferred.extend(lines)
+                        if fingerprint is not None:
+                            self.state[name] = fingerprint
+                            save_json_state(self.state_path, {'version': PIPELINE_STATE_VERSION,
+                                                              'stages': self.state})
+                    if foreground is None:
+                        for line in deferred:
+                            emit(line)
+                        deferred.clear()
+        finally:
+            for line in deferred:
+                emit(line)
+        return results
+
+def build_pipeline(args) -> Pipeline:
+    """按命令行参数组装流水线
+
+    sync/scan/fetch/index/download 自带增量机制（HEAD 缓存、TTL、条件请求、目录指纹），
+    每次都执行；metadata/collect/link 由流水线按输入与输出指纹决定是否跳过。
+    """
+    scan_ignore_dirs = DEFAULT_SCAN_IGNORE_DIRS | set(args.scan_ignore)
+    top = args.top if args.top is not None else (args.ingest_top or TOP_100_COUNT)
+    output_file = args.output or INDEX_DEFAULT_FILES[args.format]
+
+    def sync(results):
+        # 1. 同步子模块
+        return sync_submodules(args.jobs)
+
+    def scan(results):
+        # 2. 扫描子模块中的技能（通过查找 SKILL.md）
+        repo_skills = scan_submodules_for_skills(results['sync'], scan_ignore_dirs, args.nested_skills, args.jobs)
+        if not any(repo_skills.values()):
+            print_warning("未在子模块中发现任何技能")
+        return repo_skills
+
+    def metadata(results):
+        # 生成技能元数据索引（dashboard.html 与 search 子命令使用）
+        build_skills_json(results['scan'], args.skills_json)
+
+    def metadata_inputs(results):
+        return {
+            'versions': [SKILL_META_VERSION, CATALOG_VERSION, SEARCH_INDEX_VERSION],
+            'skills': skill_files_signature(results['scan']),
+        }
+
+    def metadata_outputs(results):
+        return [SCRIPT_DIR / args.skills_json, SCRIPT_DIR / CATALOG_DIR / CATALOG_HEADER_FILE,
+                SCRIPT_DIR / CACHE_DIR / SEARCH_INDEX_FILE]
+
+    def fetch(results):
+        # 3. 从 skills.sh 获取 Top 100（或分页抓取 Top N 到 JSONL 快照）
+        # 分页快照以惰性视图传给下游阶段，各阶段按需逐行读取
+        count = ingest_skills_sh(args.ingest_top, args.skills_sh_pages_url, args.ingest_jobs,
+                                 args.skills_sh_ttl, args.offline) if args.ingest_top else 0
+        if count:
+            return SkillsSnapshot(min(count, top))
+        return fetch_skills_sh_top100(args.skills_sh_ttl, args.offline)[:top]
+
+    def index(results):
+        # 4. 生成技能目录（包含仓库信息）
+        return save_index(results['scan'], results['fetch'], results['sync'], output_file, args.format, args.force)
+
+    def download(results):
+        # 5. 下载 skills.sh 仓库（可用 --skip-download 跳过）
+        if args.skip_download or not results['fetch']:
+            print_info("跳过下载 skills.sh 仓库")
+            return {}, []
+        return download_skills_sh_repos(results['fetch'], args.clone_jobs, args.clone_per_host,
+                                        args.clone_retries, args.sparse, args.refresh,
+                                        not args.skip_copy_skills, scan_ignore_dirs, args.nested_skills)
+
+    def collect(results):
+        # 6. 在暂存目录构建技能集合（本地技能 + 下载仓库中的指定技能），最后原子切换
+        output_dir = begin_staged_build()
+        copy_local_skills(results['scan'], output_dir, args.materialize)
+        downloaded_repos, skill_refs = results['download']
+        skills_sh_copied = []
+        if not args.skip_copy_skills and downloaded_repos:
+            _, skills_sh_copied = copy_skills_from_repos(downloaded_repos, skill_refs, output_dir,
+                                                         scan_ignore_dirs, args.nested_skills, args.materialize)
+        elif downloaded_repos:
+            print_info("跳过从下载仓库复制技能")
+        create_collection_readme(output_dir)
+        publish_generation(output_dir, args.keep_generations)
+        return skills_sh_copied
+
+    def collect_inputs(results):
+        # 仓库 HEAD + sparse-checkout 范围 + SKILL.md 签名；工作区中其他文件未提交的改动需 --force
+        downloaded_repos, skill_refs = results['download']
+        heads = {}
+        for repo_dir in [Path(path) for _, path, _ in results['sync']] + list(downloaded_repos.values()):
+            head = read_repo_head(repo_dir)
+            if not head:
+                return None
+            heads[str(repo_dir)] = [head, path_signature(repo_dir / ".git" / "info" / "sparse-checkout")]
+        return {
+            'options': [args.materialize, args.nested_skills, sorted(scan_ignore_dirs), args.skip_copy_skills],
+            'heads': heads,
+            'skills': skill_files_signature(results['scan']),
+            'refs': [[ref.repo, ref.name] for ref in skill_refs],
+        }
+
+    def link(results):
+        # 7. 链接到所有 AI 工具（可用 --skip-link 跳过）
+        link_skills_to_ai_tools()
+
+    def link_inputs(results):
+        return {'tools': AI_TOOLS, 'source': str(get_skills_source_dir())}
+
+    def link_outputs(results):
+        return [Path(path).expanduser() for path in sorted(set(AI_TOOLS.values()))]
+
+    return Pipeline([
+        Stage('sync', sync),
+        Stage('scan', scan, ('sync',)),
+        Stage('metadata', metadata, ('scan',), metadata_inputs, metadata_outputs),
+        Stage('fetch', fetch),
+        Stage('index', index, ('sync', 'scan', 'fetch')),
+        Stage('download', download, ('fetch',)),
+        Stage('collect', collect, ('scan', 'download'), collect_inputs, lambda results: [get_skills_source_dir()]),
+        Stage('link', link, ('collect',), link_inputs, link_outputs),
+    ], force=args.force)
+
 def parse_arguments():
     """解析命令行参数"""
     parser = argparse.ArgumentParser(
@@ -965,6 +3247,12 @@ def parse_arguments():
   %(prog)s --skip-download    # 跳过下载 skills.sh 仓库
   %(prog)s --skip-link        # 跳过链接到 AI 工具
   %(prog)s --top 50           # 只下载前 50 个技能相关的仓库
+  %(prog)s --jobs 16          # 使用 16 个并发任务同步子模块
+  %(prog)s --materialize hardlink  # 用硬链接代替复制构建技能集合
+  %(prog)s --rollback         # 技能集合回滚到上一代
+  %(prog)s --only index       # 只重新生成技能目录（及其依赖的阶段）
+  %(prog)s --profile          # 写出各阶段与每次 git 调用的 Chrome trace
+  %(prog)s search react hooks # 在本地索引中搜索技能（不联网、不重新扫描）
         """
     )
 
@@ -989,16 +3277,172 @@ def parse_arguments():
     parser.add_argument(
         '--top', '-n',
         type=int,
-        default=TOP_100_COUNT,
+        default=None,
+        metavar='N',
+        help=f'下载 skills.sh 前 N 个技能相关的仓库（默认: {TOP_100_COUNT}，使用 --ingest-top 时为其数量）'
+    )
+
+    parser.add_argument(
+        '--ingest-top',
+        type=int,
+        default=0,
         metavar='N',
-        help=f'下载 skills.sh 前 N 个技能相关的仓库（默认: {TOP_100_COUNT}）'
+        help='分页并发抓取 skills.sh 排行榜前 N 个技能（如 1000-5000），写入 JSONL 快照供后续阶段使用'
+    )
+
+    parser.add_argument(
+        '--ingest-jobs',
+        type=int,
+        default=DEFAULT_INGEST_JOBS,
+        metavar='N',
+        help=f'分页抓取时并发请求的页数（默认: {DEFAULT_INGEST_JOBS}）'
+    )
+
+    parser.add_argument(
+        '--skills-sh-pages-url',
+        type=str,
+        default=SKILLS_SH_PAGE_URL,
+        metavar='TEMPLATE',
+        help=f'排行榜分页地址模板，{{page}} 为页码（默认: {SKILLS_SH_PAGE_URL}）'
+    )
+
+    parser.add_argument(
+        '--skills-sh-ttl',
+        type=int,
+        default=DEFAULT_SKILLS_SH_TTL,
+        metavar='SECONDS',
+        help=f'skills.sh 排行榜缓存的有效期，过期后才发条件请求（默认: {DEFAULT_SKILLS_SH_TTL}，0 表示每次都请求）'
+    )
+
+    parser.add_argument(
+        '--offline',
+        action='store_true',
+        help='不请求 skills.sh，直接使用上次成功获取的排行榜（没有缓存时使用内置列表）'
+    )
+
+    parser.add_argument(
+        '--jobs', '-j',
+        type=int,
+        default=DEFAULT_SYNC_JOBS,
+        metavar='N',
+        help=f'同步、扫描子模块的并发任务数（默认: {DEFAULT_SYNC_JOBS}）'
+    )
+
+    parser.add_argument(
+        '--clone-jobs',
+        type=int,
+        default=DEFAULT_CLONE_JOBS,
+        metavar='N',
+        help=f'并发克隆 skills.sh 仓库的任务数（默认: {DEFAULT_CLONE_JOBS}）'
+    )
+
+    parser.add_argument(
+        '--clone-per-host',
+        type=int,
+        default=DEFAULT_CLONE_PER_HOST,
+        metavar='N',
+        help=f'同一主机的最大并发克隆数（默认: {DEFAULT_CLONE_PER_HOST}）'
+    )
+
+    parser.add_argument(
+        '--clone-retries',
+        type=int,
+        default=DEFAULT_CLONE_RETRIES,
+        metavar='N',
+        help=f'克隆失败后的重试次数，指数退避（默认: {DEFAULT_CLONE_RETRIES}）'
+    )
+
+    parser.add_argument(
+        '--sparse',
+        action='store_true',
+        help='无 blob 克隆 skills.sh 仓库，并通过 sparse-checkout 只检出需要的技能目录'
+    )
+
+    parser.add_argument(
+        '--refresh',
+        action='store_true',
+        help='刷新已下载的 skills.sh 仓库（浅 fetch + reset，远端未变化时跳过）'
+    )
+
+    parser.add_argument(
+        '--scan-ignore',
+        action='append',
+        default=[],
+        metavar='DIR',
+        help='扫描技能时额外忽略的目录名，可重复指定（默认已忽略 .git、node_modules、.venv 等）'
+    )
+
+    parser.add_argument(
+        '--nested-skills',
+        action='store_true',
+        help='继续查找技能目录下嵌套的 SKILL.md（默认找到后不再向下遍历）'
+    )
+
+    parser.add_argument(
+        '--materialize',
+        choices=MATERIALIZE_MODES,
+        default=DEFAULT_MATERIALIZE_MODE,
+        help='技能落地到 all_skills_collection/ 的方式: copy 复制, hardlink 硬链接, '
+             'reflink 写时复制克隆, symlink 符号链接（默认: copy；不支持时逐文件回退为复制）'
+    )
+
+    parser.add_argument(
+        '--keep-generations',
+        type=int,
+        default=DEFAULT_KEEP_GENERATIONS,
+        metavar='N',
+        help=f'保留最近 N 代技能集合用于回滚（默认: {DEFAULT_KEEP_GENERATIONS}）'
+    )
+
+    parser.add_argument(
+        '--rollback',
+        action='store_true',
+        help='把 all_skills_collection/ 切回上一代后退出'
     )
 
     parser.add_argument(
         '--output', '-o',
         type=str,
-        default=OUTPUT_MD,
-        help=f'输出 Markdown 文件名（默认: {OUTPUT_MD}）'
+        default=None,
+        help=f'输出目录文件名（默认: {OUTPUT_MD}，JSON/CSV 格式为同名 .json/.csv）'
+    )
+
+    parser.add_argument(
+        '--format',
+        choices=INDEX_FORMATS,
+        default='markdown',
+        help='技能目录的输出格式（默认: markdown）'
+    )
+
+    parser.add_argument(
+        '--skills-json',
+        type=str,
+        default=SKILLS_JSON,
+        metavar='FILE',
+        help=f'技能元数据索引文件名，供 dashboard.html 加载（默认: {SKILLS_JSON}）'
+    )
+
+    parser.add_argument(
+        '--force',
+        action='store_true',
+        help='即使输入未变化也重新执行各阶段（包括重新生成技能目录、重新构建技能集合）'
+    )
+
+    parser.add_argument(
+        '--only',
+        choices=PIPELINE_STAGES,
+        metavar='STAGE',
+        help='只运行指定阶段及其依赖: sync 同步子模块, scan 扫描技能, metadata 元数据索引, '
+             'fetch 获取排行榜, index 技能目录, download 下载仓库, collect 构建技能集合, link 链接到 AI 工具'
+    )
+
+    parser.add_argument(
+        '--profile',
+        nargs='?',
+        const=PROFILE_TRACE_FILE,
+        default=None,
+        metavar='FILE',
+        help=f'写出 Chrome trace 格式的性能记录（默认文件: {PROFILE_TRACE_FILE}），并列出最慢的子进程/克隆调用'
     )
 
     parser.add_argument(
@@ -1011,77 +3455,59 @@ def parse_arguments():
 
 def main():
     """主函数"""
+    if len(sys.argv) > 1 and sys.argv[1] == 'search':
+        sys.exit(run_search(parse_search_arguments(sys.argv[2:])))
+
     args = parse_arguments()
 
+    if args.rollback:
+        sys.exit(0 if rollback_generation() else 1)
+
     if not args.quiet:
         print_header("🚀 技能整合与下载工具")
 
-    # 1. 同步子模块（默认执行）
-    repo_info = sync_submodules()
-
-    # 2. 扫描子模块中的技能（通过查找 SKILL.md）
-    repo_skills = scan_submodules_for_skills(repo_info)
-    
-    total_local_skills = sum(len(skills) for skills in repo_skills.values())
-    if total_local_skills == 0:
-        print_warning("未在子模块中发现任何技能")
-
-    # 3. 从 skills.sh 获取 Top 100
-    skills_sh_skills = fetch_skills_sh_top100()
-    
-    # 限制数量
-    skills_sh_skills = skills_sh_skills[:args.top]
-
-    # 4. 生成 Markdown（包含仓库信息）
-    md_content = generate_markdown(repo_skills, skills_sh_skills, repo_info)
-    save_markdown(md_content, args.output)
-
-    # 5. 复制本地技能（默认执行）
-    output_dir = SCRIPT_DIR / SKILLS_OUTPUT_DIR
-    copy_local_skills(repo_skills, output_dir)
-
-    # 6. 下载 skills.sh 仓库（默认执行，可用 --skip-download 跳过）
-    downloaded_repos = {}
-    skill_to_repo = {}
-    skills_sh_copied = {}
-    if not args.skip_download and skills_sh_skills:
-        downloaded_repos, skill_to_repo = download_skills_sh_repos(skills_sh_skills)
-        
-        # 7. 从下载的仓库复制技能（默认执行，只复制指定的 skills）
-        if not args.skip_copy_skills and downloaded_repos:
-            _, skills_sh_copied = copy_skills_from_repos(downloaded_repos, skill_to_repo, output_dir)
-        elif downloaded_repos:
-            print_info("跳过从下载仓库复制技能")
-    else:
-        print_info("跳过下载 skills.sh 仓库")
-
-    # 创建 README
-    create_collection_readme()
-    
-    # 8. 链接到所有 AI 工具（默认执行，可用 --skip-link 跳过）
-    if not args.skip_link:
-        link_skills_to_ai_tools()
-    else:
+    # 各阶段组成 DAG：互不依赖的阶段（如子模块同步与 skills.sh 获取）并发执行
+    targets = [args.only] if args.only else [name for name in PIPELINE_STAGES
+                                             if not (name == 'link' and args.skip_link)]
+    results = build_pipeline(args).run(targets)
+    if args.skip_link and not args.only:
         print_info("跳过链接到 AI 工具")
 
     # 完成
     if not args.quiet:
         print_header("✅ 完成")
 
-        print_success(f"✓ Markdown 目录已生成: {args.output}")
-        print_success(f"✓ 本地技能已复制到: {SKILLS_OUTPUT_DIR}/")
+        output_file = args.output or INDEX_DEFAULT_FILES[args.format]
+        if 'index' in results:
+            index_status = "已生成" if results['index'] else "未变化"
+            print_success(f"✓ {INDEX_FORMAT_LABELS[args.format]}目录{index_status}: {output_file}")
         
-        if not args.skip_download and skills_sh_skills:
+        if 'collect' in results:
+            if results['collect'] is None:
+                print_success(f"✓ 技能集合未变化: {SKILLS_OUTPUT_DIR}/")
+            else:
+                print_success(f"✓ 本地技能已复制到: {SKILLS_OUTPUT_DIR}/")
+        
+        if results.get('download', ({}, []))[0]:
             print_success(f"✓ Skills.sh 仓库已下载到: {SKILLS_SH_DOWNLOADS_DIR}/")
-            if not args.skip_copy_skills:
-                print_success(f"✓ Skills.sh 技能已复制到: {SKILLS_OUTPUT_DIR}/")
+            if results.get('collect') and not args.skip_copy_skills:
+                print_success(f"✓ Skills.sh 技能已复制到: {SKILLS_OUTPUT_DIR}/ ({len(results['collect'])} 个)")
         
-        if not args.skip_link:
+        if 'link' in results:
             print_success(f"✓ 技能已链接到 {len(AI_TOOLS)} 个 AI 工具")
 
-        print_info(f"\n查看目录: cat {args.output}")
+        if 'index' in results:
+            print_info(f"\n查看目录: cat {output_file}")
         print_info(f"浏览技能: ls -la {SKILLS_OUTPUT_DIR}/\n")
 
+    # 各阶段统计（--profile 时另写出 Chrome trace）
+    if not args.quiet or args.profile:
+        _profiler.print_summary(PROFILE_SLOWEST_CALLS if args.profile else 0)
+    if args.profile:
+        trace_path = SCRIPT_DIR / args.profile
+        _profiler.write_trace(trace_path)
+        print_success(f"性能记录已写出: {trace_path}（在 chrome://tracing 或 https://ui.perfetto.dev 中打开）")
+
 if __name__ == '__main__':
     try:
         main()